@@ -0,0 +1,405 @@
+"""Benchmarks for the Monte Carlo contribution pipeline in `bw_helpers`.
+
+The real calculations need the licensed ecoinvent cutoff38 database, so the
+benchmarks run on a synthetic Brightway project instead: a large, sparse
+background database with lognormal uncertainties, linked to small
+foreground databases structured like ours (device databases for UKR, CM HTO
+and AM HTO, using shared "Raw materials" and "Electricity" databases).
+
+Each stage of `collect_contribution_samples` is timed, along with the
+overall throughput (samples/s) and peak memory -- the peak resident set
+size of the process, which includes the solvers' C allocations, and the
+peak Python heap while sampling -- and compared against a stored baseline. Run with::
+
+    python benchmarks.py --size medium --samples 20
+    python benchmarks.py --size medium --samples 20 --save-baseline
+
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+PROJECT = "bw_helpers_benchmark"
+
+# Number of background activities; "cutoff38" is about the size of
+# ecoinvent 3.8 cutoff
+SIZES = {
+    "small": 500,
+    "medium": 5000,
+    "cutoff38": 19500,
+}
+
+DEVICES = ["UKR", "CM HTO", "AM HTO"]
+
+# Foreground processes in each device database, and the label they map to
+FOREGROUND_LABELS = {
+    "material": "Implant (material)",
+    "machining": "Implant (manufac.)",
+    "argon": "Argon",
+    "instruments": "Instruments (material)",
+    "packaging": "Packaging",
+    "sterilisation": "Sterilisation",
+    "transport": "Transport",
+}
+
+# Processes shared between the devices, and the database they live in
+SHARED_DATABASES = {
+    "material": "synthetic Raw materials",
+    "argon": "synthetic Raw materials",
+    "instruments": "synthetic Raw materials",
+    "machining": "synthetic Electricity",
+}
+
+COMPONENT_ORDER = ["Total"] + list(FOREGROUND_LABELS.values())
+
+METHOD = ("synthetic", "climate change", "GWP")
+
+DEFAULT_BASELINE = Path(__file__).parent / "benchmark_baseline.json"
+
+
+def _lognormal(amount, scale, uncertain=True):
+    """Exchange fields for a lognormal uncertainty around `amount`."""
+    if not uncertain or amount <= 0:
+        return {"amount": amount}
+    return {
+        "amount": amount,
+        "uncertainty type": 2,
+        "loc": float(np.log(amount)),
+        "scale": scale,
+    }
+
+
+def generate_synthetic_project(size="medium", num_flows=2000, inputs_per_activity=8,
+                               flows_per_activity=10, uncertain_fraction=0.7,
+                               project=PROJECT, seed=0, overwrite=False):
+    """Write synthetic databases and an LCIA method into `project`.
+
+    The background database has SIZES[size] activities (or `size` itself if
+    it is a number), each with about `inputs_per_activity` technosphere
+    inputs and `flows_per_activity` biosphere flows. A fraction
+    `uncertain_fraction` of exchanges have lognormal uncertainty.
+
+    Returns a dictionary with the `demands`, `demand_labels`,
+    `final_activities` and `component_order` to use for
+    `collect_contribution_samples`. Existing databases made with the same
+    arguments are reused unless `overwrite` is True.
+    """
+    import brightway2 as bw
+
+    num_background = SIZES.get(size, size)
+    params = {
+        "num_background": int(num_background),
+        "num_flows": num_flows,
+        "inputs_per_activity": inputs_per_activity,
+        "flows_per_activity": flows_per_activity,
+        "uncertain_fraction": uncertain_fraction,
+        "seed": seed,
+    }
+
+    bw.projects.set_current(project)
+    background = f"synthetic background {num_background}"
+    spec = _synthetic_spec(background)
+    existing = bw.databases.get(background, {}).get("synthetic_params")
+    if existing == params and not overwrite:
+        _log.info("Reusing synthetic databases in project %s", project)
+        return spec
+
+    rng = np.random.default_rng(seed)
+    biosphere = "synthetic biosphere"
+    flow_keys = [(biosphere, f"flow-{i}") for i in range(num_flows)]
+    bw.Database(biosphere).write({
+        key: {"name": key[1], "type": "emission", "unit": "kg", "categories": ("air",)}
+        for key in flow_keys
+    })
+
+    def maybe_uncertain():
+        return bool(rng.random() < uncertain_fraction)
+
+    def biosphere_exchanges(count):
+        flows = rng.choice(num_flows, size=count, replace=False)
+        return [
+            {"input": flow_keys[f], "type": "biosphere",
+             **_lognormal(float(rng.lognormal(-3, 1.5)), 0.3, maybe_uncertain())}
+            for f in flows
+        ]
+
+    # Background: sparse random inputs, small enough to keep the system
+    # well conditioned
+    background_keys = [(background, f"act-{i}") for i in range(num_background)]
+    data = {}
+    for i, key in enumerate(background_keys):
+        inputs = rng.choice(num_background, size=inputs_per_activity, replace=False)
+        exchanges = [{"input": key, "type": "production", "amount": 1.0}]
+        exchanges += [
+            {"input": background_keys[j], "type": "technosphere",
+             **_lognormal(float(rng.uniform(0.001, 0.08)), 0.2, maybe_uncertain())}
+            for j in inputs if j != i
+        ]
+        exchanges += biosphere_exchanges(flows_per_activity)
+        data[key] = {"name": f"background {i}", "unit": "kg", "location": "GLO",
+                     "exchanges": exchanges}
+    bw.Database(background).write(data)
+
+    def background_inputs(count):
+        return [
+            {"input": background_keys[j], "type": "technosphere",
+             **_lognormal(float(rng.uniform(0.05, 2)), 0.2, maybe_uncertain())}
+            for j in rng.choice(num_background, size=count, replace=False)
+        ]
+
+    # Shared foreground databases, like "Raw materials" and "Electricity"
+    shared = {}
+    shared_data = {}
+    for name, database in SHARED_DATABASES.items():
+        key = shared[name] = (database, name)
+        shared_data.setdefault(database, {})[key] = {
+            "name": name, "unit": "kg", "location": "GLO",
+            "exchanges": [{"input": key, "type": "production", "amount": 1.0}]
+            + background_inputs(5) + biosphere_exchanges(3),
+        }
+    for database, database_data in shared_data.items():
+        bw.Database(database).write(database_data)
+
+    # One database per device, each with a top-level activity using
+    # processes for all the labelled components
+    for device in DEVICES:
+        database = f"synthetic {device}"
+        device_data = {}
+        top = (database, "total")
+        top_exchanges = [{"input": top, "type": "production", "amount": 1.0}]
+        for name in FOREGROUND_LABELS:
+            if name in shared:
+                input_key = shared[name]
+            else:
+                input_key = (database, name)
+                device_data[input_key] = {
+                    "name": f"{device} {name}", "unit": "unit", "location": "GB",
+                    "exchanges": [{"input": input_key, "type": "production", "amount": 1.0}]
+                    + background_inputs(4),
+                }
+            top_exchanges.append({
+                "input": input_key, "type": "technosphere",
+                **_lognormal(float(rng.uniform(0.1, 3)), 0.1, True),
+            })
+        device_data[top] = {"name": device, "unit": "unit", "location": "GB",
+                            "exchanges": top_exchanges}
+        bw.Database(database).write(device_data)
+
+    method = bw.Method(METHOD)
+    if method.name not in bw.methods:
+        method.register(unit="kg CO2-Eq")
+    method.write([
+        (key, _lognormal(float(rng.lognormal(0, 2)), 0.05, rng.random() < 0.1))
+        for key in flow_keys
+        if rng.random() < 0.3
+    ])
+
+    bw.databases[background]["synthetic_params"] = params
+    bw.databases.flush()
+    return spec
+
+
+def _synthetic_spec(background):
+    demands = [{(f"synthetic {device}", "total"): 1} for device in DEVICES]
+    final_activities = {(f"synthetic {device}", "total"): "Total" for device in DEVICES}
+    for device in DEVICES:
+        for name, label in FOREGROUND_LABELS.items():
+            database = SHARED_DATABASES.get(name, f"synthetic {device}")
+            final_activities[(database, name)] = label
+    return {
+        "background": background,
+        "demands": demands,
+        "demand_labels": list(DEVICES),
+        "final_activities": final_activities,
+        "component_order": COMPONENT_ORDER,
+    }
+
+
+class StageTimer:
+    """Collect wall times for named stages."""
+
+    def __init__(self):
+        self.times = {}
+
+    def time(self, stage, func, *args, repeat=1, **kwargs):
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.times.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        return {stage: float(np.median(times)) for stage, times in self.times.items()}
+
+
+def run_benchmarks(spec, num_samples=20, repeat=5):
+    """Time each stage of the contribution pipeline on the synthetic project.
+
+    Returns a dictionary of median stage times (s), the throughput of
+    `collect_contribution_samples` (samples/s), the peak resident set size
+    of the process and the peak Python heap traced while sampling (MB).
+    """
+    from bw_helpers import (
+        MyMonteCarloLCA, ScoreGrouper, collect_contribution_samples, make_solver_backend,
+        recursive_calculation, sample_comparative_contribution,
+    )
+
+    demands = spec["demands"]
+    demand_dict = {k: v for demand in demands for k, v in demand.items()}
+    final_activities = spec["final_activities"]
+    timer = StageTimer()
+
+    # bw2calc only loads the matrices when they are first needed, so time
+    # the loading itself rather than the constructor
+    lca = timer.time("constructor", lambda: MyMonteCarloLCA(demand_dict, method=METHOD))
+    timer.time("load_data", lca.load_data)
+    timer.time("first sample (solve)", next, lca)
+
+    timer.time("new_sample", lca.new_sample, repeat=repeat)
+
+    def sample_and_solve():
+        lca.new_sample()
+        return lca.solve_linear_system()
+
+    timer.time("new_sample + solve_linear_system", sample_and_solve, repeat=repeat)
+    timer.time("decompose_technosphere", lca.decompose_technosphere, repeat=repeat)
+
+    # The same with a solver backend, to compare with decompose_technosphere:
+    # the first factorization includes the symbolic analysis, which UMFPACK
+    # then reuses (SciPy only reuses the column ordering)
+    backend = make_solver_backend("auto")
+    timer.time(f"{backend.name} backend: first factorization",
+               backend.factorize, lca.technosphere_matrix)
+    timer.time(f"{backend.name} backend: numeric refactorization",
+               backend.factorize, lca.technosphere_matrix, repeat=repeat)
+    lca.redo_lcia(demands[0])
+    timer.time("ScoreGrouper", lambda: ScoreGrouper(lca)(final_activities), repeat=repeat)
+    # Without the devices' "Total" entries, which would stop the traversal
+    # at the root
+    below_root = {key: label for key, label in final_activities.items() if label != "Total"}
+    timer.time(
+        "recursive_calculation",
+        lambda: recursive_calculation(
+            next(iter(demands[0])), below_root, METHOD, lca_obj=lca,
+            max_level=8, cutoff=1e-8,
+        ),
+        repeat=repeat,
+    )
+    timer.time(
+        "sample_comparative_contribution",
+        sample_comparative_contribution, lca, demands, final_activities,
+        repeat=repeat,
+    )
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    collect_contribution_samples(
+        lca, demands, final_activities, num_samples=num_samples,
+        method_label=METHOD[1], demand_labels=spec["demand_labels"],
+        component_order=spec["component_order"],
+    )
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "stages": timer.summary(),
+        "samples_per_second": num_samples / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_python_heap_mb": peak / 1e6,
+        "matrix_size": int(lca.technosphere_matrix.shape[0]),
+        "backend_factorizations": {
+            "backend": backend.name,
+            "symbolic": backend.symbolic_count,
+            "numeric": backend.numeric_count,
+        },
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB), or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def compare_to_baseline(results, baseline, tolerance=1.25):
+    """Return lines comparing `results` with `baseline`, flagging regressions.
+
+    Stages slower than `tolerance` times the baseline, or throughput lower
+    than the baseline divided by `tolerance`, are marked "REGRESSION".
+    """
+    lines = []
+    for stage, seconds in results["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before is None:
+            lines.append(f"{stage:40s} {seconds * 1e3:10.2f} ms   (new)")
+            continue
+        ratio = seconds / before
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        lines.append(f"{stage:40s} {seconds * 1e3:10.2f} ms  x{ratio:5.2f}{flag}")
+    for key, higher_is_better in [("samples_per_second", True), ("peak_rss_mb", False),
+                                  ("peak_python_heap_mb", False)]:
+        value, before = results[key], baseline.get(key)
+        if value is None:
+            continue
+        if before:
+            ratio = value / before
+            worse = ratio < 1 / tolerance if higher_is_better else ratio > tolerance
+            flag = "  REGRESSION" if worse else ""
+            lines.append(f"{key:40s} {value:10.2f}     x{ratio:5.2f}{flag}")
+        else:
+            lines.append(f"{key:40s} {value:10.2f}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="small",
+                        help=f"background size: one of {list(SIZES)} or a number")
+    parser.add_argument("--samples", type=int, default=20,
+                        help="Monte Carlo samples for the throughput measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats for each stage timing")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline for this size")
+    parser.add_argument("--project", default=PROJECT)
+    args = parser.parse_args(argv)
+
+    size = int(args.size) if args.size.isdigit() else args.size
+    spec = generate_synthetic_project(size, project=args.project)
+    results = run_benchmarks(spec, num_samples=args.samples, repeat=args.repeat)
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    size_key = str(size)
+    for line in compare_to_baseline(results, baselines.get(size_key, {})):
+        print(line)
+    counts = results["backend_factorizations"]
+    print(f"{counts['backend']} backend: {counts['symbolic']} symbolic analyses, "
+          f"{counts['numeric']} numeric factorizations")
+
+    if args.save_baseline:
+        baselines[size_key] = results
+        args.baseline.write_text(json.dumps(baselines, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,25 @@
 import numpy as np
 import bw2calc as bc
+import hashlib
+import json
 import logging
+import os
+import pickle
+import shutil
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
 import pandas as pd
 import brightway2 as bw
+from instrumentation import instrumentation
+from mc_results import ConvergenceMonitor, StatisticsAccumulator, accumulator_series
+from sensitivity import InputDrawStore
+from scipy import sparse
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator, spilu, splu
+from stats_arrays import MCRandomNumberGenerator, UncertaintyBase, uncertainty_choices
+from bw2calc.matrices import MatrixBuilder
 
 _log = logging.getLogger(__name__)
 
@@ -13,6 +30,497 @@ except ImportError:
     from scipy.sparse.linalg import spsolve
 
 
+def solve_many(solver, rhs):
+    """Solve for several right-hand sides at once using `solver`.
+
+    `solver` is a factorized solver, like `lca.solver`, and `rhs` is a
+    (sparse or dense) matrix with one demand vector per column. Returns a
+    dense array of solutions, one per column.
+
+    SuperLU solves all the columns in one call; other solvers (e.g. UMFPACK)
+    only accept vectors, so fall back to solving column by column.
+    """
+    if sparse.issparse(rhs):
+        rhs = rhs.toarray()
+    rhs = np.asarray(rhs, dtype=float)
+    if rhs.ndim == 1:
+        return solver(rhs)
+    if rhs.shape[1] == 0:
+        return np.zeros(rhs.shape)
+    try:
+        solution = solver(rhs)
+    except (ValueError, TypeError, RuntimeError):
+        solution = None
+    if solution is None or np.shape(solution) != rhs.shape:
+        solution = np.column_stack([solver(rhs[:, j]) for j in range(rhs.shape[1])])
+    return solution
+
+
+def build_characterization_matrix(lca, method):
+    """Build the characterization matrix of `method` for the biosphere of `lca`.
+
+    Returns (cf_params, characterization_matrix), as `lca.load_lcia_data`
+    would for the LCA's own method.
+    """
+    cf_params, _, _, matrix = MatrixBuilder.build(
+        [bw.Method(method).filepath_processed()],
+        "amount", "flow", "row",
+        row_dict=lca._biosphere_dict,
+        one_d=True,
+    )
+    return cf_params, matrix
+
+
+class MatrixCache:
+    """On-disk cache of the processed matrices and dictionaries of an LCA.
+
+    Loading the full project (including cutoff38) and building the matrices
+    is slow, and the result only depends on the processed database and
+    method files. This stores the parameter arrays, matrices and
+    activity/product/biosphere dictionaries under `directory`, in a
+    subdirectory named by a hash of the processed files used (paths, sizes
+    and modification times) and any presamples. Arrays are memory-mapped
+    (copy-on-write) when loaded, so parallel workers share the pages.
+
+    Used by `MyMonteCarloLCA(..., cache_dir=...)`.
+    """
+
+    ARRAYS = ["tech_params", "bio_params", "cf_params"]
+    MATRICES = ["technosphere_matrix", "biosphere_matrix", "characterization_matrix"]
+    DICTS = [
+        "activity_dict", "product_dict", "biosphere_dict",
+        "_activity_dict", "_product_dict", "_biosphere_dict",
+    ]
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(lca):
+        """Hash identifying the inputs used to build the matrices of `lca`."""
+        paths = list(lca.database_filepath or [])
+        if lca.lcia:
+            paths += list(lca.method_filepath or [])
+        paths += list(getattr(lca, "presamples_paths", None) or [])
+        digest = hashlib.sha256()
+        digest.update(repr((bc.__version__, lca.lcia)).encode())
+        for path in paths:
+            path = Path(path)
+            for sub in sorted(path.rglob("*")) if path.is_dir() else [path]:
+                stat = sub.stat()
+                digest.update(repr((str(sub), stat.st_size, stat.st_mtime_ns)).encode())
+        return digest.hexdigest()[:24]
+
+    def path(self, lca):
+        return self.directory / self.key(lca)
+
+    def load(self, lca):
+        """Load cached data into `lca`. Returns False if there is none."""
+        path = self.path(lca)
+        if not (path / "dicts.pickle").exists():
+            return False
+        _log.debug("Loading matrices from cache %s", path)
+        for name in self.ARRAYS:
+            if (path / f"{name}.npy").exists():
+                setattr(lca, name, np.load(path / f"{name}.npy", mmap_mode="c"))
+        for name in self.MATRICES:
+            if (path / f"{name}.data.npy").exists():
+                parts = [
+                    np.load(path / f"{name}.{part}.npy", mmap_mode="c")
+                    for part in ("data", "indices", "indptr")
+                ]
+                shape = tuple(np.load(path / f"{name}.shape.npy"))
+                setattr(lca, name, sparse.csr_matrix(tuple(parts), shape=shape))
+        with open(path / "dicts.pickle", "rb") as f:
+            for name, value in pickle.load(f).items():
+                setattr(lca, name, value)
+        lca._fixed = True
+        return True
+
+    def save(self, lca):
+        """Save the data loaded by `lca` into the cache."""
+        path = self.path(lca)
+        tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            if hasattr(lca, name):
+                np.save(tmp_path / f"{name}.npy", getattr(lca, name))
+        for name in self.MATRICES:
+            if hasattr(lca, name):
+                matrix = getattr(lca, name).tocsr()
+                for part in ("data", "indices", "indptr", "shape"):
+                    np.save(tmp_path / f"{name}.{part}.npy", np.asarray(getattr(matrix, part)))
+        with open(tmp_path / "dicts.pickle", "wb") as f:
+            pickle.dump({name: getattr(lca, name) for name in self.DICTS}, f)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process got there first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        _log.debug("Saved matrices to cache %s", path)
+
+
+UNCERTAINTY_FIELDS = {
+    "amount": "amount",
+    "uncertainty type": "uncertainty_type",
+    "loc": "loc",
+    "scale": "scale",
+    "shape": "shape",
+    "minimum": "minimum",
+    "maximum": "maximum",
+    "negative": "negative",
+}
+
+
+def get_exchanges(pairs):
+    """Look up the technosphere exchanges for many (input, output) pairs at once.
+
+    Returns {(input_key, output_key): exchange data} using a single database
+    query, instead of scanning `output.technosphere()` for each pair. Raises
+    a KeyError listing any pairs which were not found.
+    """
+    from bw2data.backends.peewee import ExchangeDataset
+
+    pairs = {(_as_key(i), _as_key(o)) for i, o in pairs}
+    query = ExchangeDataset.select().where(
+        ExchangeDataset.output_code.in_({o[1] for _, o in pairs})
+        & ExchangeDataset.input_code.in_({i[1] for i, _ in pairs})
+        & (ExchangeDataset.type == "technosphere")
+    )
+    found = {}
+    for exc in query:
+        pair = ((exc.input_database, exc.input_code), (exc.output_database, exc.output_code))
+        if pair in pairs:
+            found[pair] = exc.data
+    missing = pairs - set(found)
+    if missing:
+        raise KeyError(f"Exchanges not found: {sorted(missing)}")
+    return found
+
+
+def sample_exchanges(exchanges, num_samples, seed=None):
+    """Draw `num_samples` values for each exchange from its uncertainty.
+
+    `exchanges` is a list of exchange data dictionaries. All exchanges with
+    the same distribution are sampled in one vectorized call. Returns an
+    array (exchange x sample). Values are kept within each exchange's
+    minimum and maximum.
+    """
+    params = UncertaintyBase.from_dicts(*[
+        {
+            "uncertainty_type": 0,
+            "loc": exc["amount"],
+            **{field: exc[key] for key, field in UNCERTAINTY_FIELDS.items() if key in exc},
+        }
+        for exc in exchanges
+    ])
+    samples = np.zeros((len(params), num_samples))
+    types = np.unique(params["uncertainty_type"])
+    seeds = np.random.SeedSequence(seed).spawn(len(types))
+    for uncertainty_type, child in zip(types, seeds):
+        mask = params["uncertainty_type"] == uncertainty_type
+        distribution = uncertainty_choices[int(uncertainty_type)]
+        samples[mask] = distribution.bounded_random_variables(
+            params[mask], num_samples,
+            seeded_random=np.random.RandomState(child.generate_state(1)[0]),
+        )
+    return samples
+
+
+def build_swap_presamples(swaps, num_samples, seed=None, directory=None, name=None):
+    """Create (or reuse) a presamples package swapping inputs of processes.
+
+    `swaps` is a list of (old_input, new_input, outputs): for each process in
+    `outputs`, `new_input` takes values sampled from the uncertainty of the
+    `old_input` exchange, and `old_input` is set to zero. This is what
+    `samples_to_swap_inputs` did in `Comparative LCA.ipynb`, but the
+    exchanges are found with one query and sampled in one vectorized pass.
+
+    The package is stored in `directory` (by default in the project's output
+    directory) under a hash of the swaps, the exchanges' uncertainty data,
+    `num_samples` and `seed`, so re-running with the same inputs reuses it.
+    Without a `seed`, a fresh one is drawn, so every call makes a new package.
+    Returns (id, path) as `presamples.create_presamples_package` does.
+    """
+    import presamples as ps
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        _log.info("Using random seed %s for presamples", seed)
+    swaps = [
+        (_as_key(old), _as_key(new), [_as_key(o) for o in outputs])
+        for old, new, outputs in swaps
+    ]
+    exchanges = get_exchanges((old, output) for old, _, outputs in swaps for output in outputs)
+
+    indices = []
+    sampled = []
+    for old, new, outputs in swaps:
+        for output in outputs:
+            indices.append((new, output, "technosphere"))
+            sampled.append(exchanges[(old, output)])
+            indices.append((old, output, "technosphere"))
+            sampled.append(None)
+
+    digest = hashlib.sha256(json.dumps(
+        [indices, sampled, num_samples, seed], sort_keys=True, default=str
+    ).encode()).hexdigest()[:24]
+    if directory is None:
+        directory = Path(bw.projects.output_dir) / "presamples-cache"
+    path = Path(directory) / digest
+    if path.exists():
+        _log.debug("Reusing presamples package %s", path)
+        return digest, path
+
+    data = np.zeros((len(indices), num_samples))
+    rows = [i for i, exc in enumerate(sampled) if exc is not None]
+    data[rows] = sample_exchanges([sampled[i] for i in rows], num_samples, seed)
+    return ps.create_presamples_package(
+        matrix_data=[(data, indices, "technosphere")],
+        name=name,
+        id_=digest,
+        dirpath=directory,
+    )
+
+
+class TechnosphereScenario:
+    """A small set of edits to the technosphere matrix.
+
+    `values` is a list of (input, output, value) to set the matrix entry for
+    `input` into `output` to `value` (in matrix convention, so inputs are
+    negative). `swaps` is a list of (old_input, new_input, output): the
+    current sampled value of `old_input` into `output` is moved to
+    `new_input`, and `old_input` is set to zero -- like the electricity swaps
+    in the low-carbon electricity scenario, but paired with the baseline
+    sample. Activities can be given as activities or keys.
+
+    Example::
+
+        greener = TechnosphereScenario(swaps=[
+            (elec_GB, elec_CH, process) for process in slm_and_polishing_processes
+        ])
+    """
+
+    def __init__(self, values=(), swaps=()):
+        self.values = [(_as_key(i), _as_key(o), v) for i, o, v in values]
+        self.swaps = [(_as_key(old), _as_key(new), _as_key(o)) for old, new, o in swaps]
+
+    def resolve(self, lca):
+        """Return (rows, cols, new values) for the current matrix of `lca`."""
+        matrix = lca.technosphere_matrix
+        edits = {}
+        for old, new, output in self.swaps:
+            col = lca.activity_dict[output]
+            old_row, new_row = lca.product_dict[old], lca.product_dict[new]
+            edits[(new_row, col)] = matrix[old_row, col]
+            edits[(old_row, col)] = 0.0
+        for input_, output, value in self.values:
+            edits[(lca.product_dict[input_], lca.activity_dict[output])] = value
+        rows = np.array([row for row, _ in edits], dtype=int)
+        cols = np.array([col for _, col in edits], dtype=int)
+        return rows, cols, np.array(list(edits.values()), dtype=float)
+
+
+class WoodburySolver:
+    """Solve (A + P diag(delta) Q^T) x = b, given a factorized solver for A.
+
+    P and Q pick out the `rows` and `cols` of the edited entries. The edited
+    system is solved with the Sherman-Morrison-Woodbury identity, which
+    needs one solve with A per edited entry up front, then one solve with A
+    and a small dense solve per right-hand side.
+    """
+
+    def __init__(self, base_solver, size, rows, cols, delta):
+        self.base_solver = base_solver
+        self.cols = cols
+        self.delta = delta
+        columns = sparse.csc_matrix(
+            (np.ones(len(rows)), (rows, np.arange(len(rows)))),
+            shape=(size, len(rows)),
+        )
+        self.z = solve_many(base_solver, columns)
+        capacitance = np.eye(len(rows)) + delta[:, None] * self.z[cols, :]
+        self.capacitance = lu_factor(capacitance)
+
+    def __call__(self, demand):
+        y = solve_many(self.base_solver, demand)
+        if len(self.delta) == 0:
+            return y
+        delta = self.delta.reshape((-1,) + (1,) * (y.ndim - 1))
+        return y - self.z @ lu_solve(self.capacitance, delta * y[self.cols])
+
+
+class Factorization:
+    """A factorized matrix: call it to solve A x = b.
+
+    `transpose_solve` solves A^T x = b with the same factors.
+    """
+
+    def __init__(self, solve, transpose_solve):
+        self._solve = solve
+        self.transpose_solve = transpose_solve
+
+    def __call__(self, b):
+        return self._solve(b)
+
+
+class SolverBackend:
+    """Factorize technosphere matrices which share one sparsity pattern.
+
+    This is the SciPy (SuperLU) version. SuperLU can't keep a symbolic
+    factorization, so only the column ordering of the first matrix is
+    reused: later matrices with the same sparsity pattern are permuted by it
+    and factorized without reordering, but SuperLU still redoes the rest of
+    the symbolic work for each one. This saves little (under 10% per
+    factorization on the technosphere matrices here); `UmfpackBackend` is the
+    one which does the symbolic analysis only once.
+
+    `symbolic_count` and `numeric_count` count the symbolic analyses and
+    numeric factorizations actually done; for SuperLU, every factorization
+    does both.
+    """
+
+    name = "scipy"
+
+    def __init__(self):
+        self.pattern = None
+        self.symbolic_count = 0
+        self.numeric_count = 0
+
+    def _same_pattern(self, matrix):
+        if self.pattern is not None:
+            indptr, indices = self.pattern
+            if np.array_equal(indptr, matrix.indptr) and np.array_equal(indices, matrix.indices):
+                return True
+        self.pattern = (matrix.indptr.copy(), matrix.indices.copy())
+        return False
+
+    @staticmethod
+    def _csc(matrix):
+        matrix = sparse.csc_matrix(matrix)
+        matrix.sort_indices()
+        return matrix
+
+    def factorize(self, matrix):
+        """Return a `Factorization` of `matrix`."""
+        matrix = self._csc(matrix)
+        if not self._same_pattern(matrix):
+            self.perm = splu(matrix).perm_c
+            self.symbolic_count += 1
+            self.numeric_count += 1
+        lu = splu(matrix[:, self.perm], permc_spec="NATURAL")
+        self.symbolic_count += 1
+        self.numeric_count += 1
+        perm = self.perm
+
+        def solve(b):
+            x = np.empty_like(b, dtype=float)
+            x[perm] = lu.solve(np.asarray(b, dtype=float))
+            return x
+
+        def transpose_solve(b):
+            return lu.solve(np.asarray(b, dtype=float)[perm], trans="T")
+
+        return Factorization(solve, transpose_solve)
+
+
+class UmfpackBackend(SolverBackend):
+    """`SolverBackend` using UMFPACK (scikit-umfpack).
+
+    The symbolic analysis is done once, and again only if the sparsity
+    pattern changes; each matrix then only needs the numeric factorization.
+    `UmfpackContext.numeric` frees the symbolic object along with the old
+    numeric one, so the numeric factorization is done by calling the
+    library directly, keeping the symbolic object. Solutions from a
+    factorization are only valid until the next call to `factorize`, since
+    UMFPACK keeps one numeric factorization per context -- as with
+    `lca.solver`, which is dropped whenever a new sample is drawn.
+    """
+
+    name = "umfpack"
+
+    def __init__(self):
+        # The low-level module, which has the UMFPACK constants and statuses
+        from scikits.umfpack import umfpack
+
+        super().__init__()
+        self.umfpack = umfpack
+        self.context = None
+
+    def factorize(self, matrix):
+        matrix = self._csc(matrix)
+        family = "di" if matrix.indices.dtype == np.int32 else "dl"
+        if self.context is None or self.context.family != family:
+            self.context = self._new_context(family)
+            self.pattern = None
+        context, umfpack = self.context, self.umfpack
+        if not self._same_pattern(matrix) or context._symbolic is None:
+            context.symbolic(matrix)
+
+        if context._numeric is not None:
+            context.funs.free_numeric(context._numeric)
+            context._numeric = None
+        status, context._numeric = context.funs.numeric(
+            matrix.indptr, context._getIndx(matrix), matrix.data, context._symbolic,
+            context.control, context.info,
+        )
+        if status == umfpack.UMFPACK_WARNING_singular_matrix:
+            _log.warning("Singular technosphere matrix")
+        elif status != umfpack.UMFPACK_OK:
+            raise RuntimeError(f"UMFPACK numeric factorization failed: {umfpack.umfStatus[status]}")
+        self.numeric_count += 1
+        # `solve` refactorizes unless given the matrix it last saw
+        context.mtx = matrix
+
+        def solve(b):
+            return context.solve(umfpack.UMFPACK_A, matrix, np.asarray(b, dtype=float),
+                                 autoTranspose=False)
+
+        def transpose_solve(b):
+            return context.solve(umfpack.UMFPACK_At, matrix, np.asarray(b, dtype=float),
+                                 autoTranspose=False)
+
+        return Factorization(solve, transpose_solve)
+
+    def _new_context(self, family):
+        """An `UmfpackContext` which counts its symbolic analyses.
+
+        This also counts those the context does by itself, for example if
+        `solve` is given a different matrix.
+        """
+        context = self.umfpack.UmfpackContext(family)
+        symbolic = context.symbolic
+
+        def counted_symbolic(matrix):
+            self.symbolic_count += 1
+            return symbolic(matrix)
+
+        context.symbolic = counted_symbolic
+        return context
+
+
+def make_solver_backend(kind="auto"):
+    """Return a `SolverBackend`: "umfpack", "scipy", or "auto" for UMFPACK if installed.
+
+    Only UMFPACK reuses the symbolic analysis; see `SolverBackend`.
+    """
+    if kind == "auto":
+        try:
+            return UmfpackBackend()
+        except ImportError:
+            _log.info("scikit-umfpack is not installed: only the column ordering is reused")
+            return SolverBackend()
+    if kind == "umfpack":
+        return UmfpackBackend()
+    if kind == "scipy":
+        return SolverBackend()
+    raise ValueError(f"Unknown solver backend: {kind}")
+
+
+def _new_solver_stats():
+    return {"iterative_solves": 0, "iterations": 0, "fallbacks": 0, "direct_solves": 0}
+
+
 class MyMonteCarloLCA(bc.MonteCarloLCA):
     """Smarter iterative solution when doing contribution analysis.
 
@@ -20,79 +528,434 @@ class MyMonteCarloLCA(bc.MonteCarloLCA):
     between calculating for multiple activities (like in contribution analysis)
     it does not solve efficiiently.
 
-    Here we store different guesses for different demand vectors.
+    Here we store different guesses for different demand vectors, keeping
+    only the `max_guesses` most recently used.
+
+    If `preconditioner` is "ilu" or "lu", an incomplete or complete LU
+    factorization of the deterministic technosphere matrix is built when the
+    data is loaded, and used to precondition the iterative solver for every
+    sample. `maxiter` limits the iterations before falling back to a direct
+    solve. Iterations and fallbacks are counted in `solver_stats` for the
+    current sample, and kept for every sample in `solver_history`.
+
+    If `record_draws` is a directory, the values drawn for the uncertain
+    entries of each sample (and the entries set by presamples) are written
+    to a `sensitivity.InputDrawStore` there, with room for `num_draws`
+    samples, for sensitivity analysis afterwards.
+
+    If `solver_backend` is given ("umfpack", "scipy" or "auto", see
+    `make_solver_backend`), factorizations and direct solves go through it.
+    With UMFPACK, the symbolic analysis of the technosphere matrix is done
+    once and only the numeric factorization is repeated for each sample;
+    the SciPy backend only reuses the column ordering, which saves little.
     """
 
-    def __init__(self, *args, **kwargs):
+    # Generators whose draws are recorded, and the parameters they sample
+    DRAW_GROUPS = {
+        "technosphere": ("tech_rng", "tech_params"),
+        "biosphere": ("bio_rng", "bio_params"),
+        "characterization": ("cf_rng", "cf_params"),
+    }
+    PRESAMPLED_MATRICES = ["technosphere_matrix", "biosphere_matrix", "characterization_matrix"]
+
+    def __init__(self, *args, max_guesses=32, preconditioner=None, maxiter=1000,
+                 cache_dir=None, record_draws=None, num_draws=None, solver_backend=None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Cache guesses by current demand vector
-        self.guesses = {}
+        # `redo_lcia` replaces `self.demand`, but the matrices cover the
+        # databases needed by the demand given here
+        self._initial_demand = dict(self.demand)
+
+        # Processed matrices are cached here, if given (see `MatrixCache`)
+        self.cache_dir = cache_dir
 
-    def new_sample(self):
-        """Get new samples like __next__ but don't calculate anything."""
+        # Cache guesses by current demand vector, least recently used first
+        self.guesses = OrderedDict()
+        self.max_guesses = max_guesses
+
+        self.preconditioner_kind = preconditioner
+        self.preconditioner = None
+        self.maxiter = maxiter
+        self.solver_stats = _new_solver_stats()
+        self.solver_history = []
+
+        # Keep the presamples paths so the package can be reloaded with a new
+        # seed by `reseed`
+        self.presamples_paths = kwargs.get("presamples")
+
+        # Additional LCIA methods, set up by `load_methods`
+        self.methods = []
+        self.method_params = []
+        self.method_matrices = []
+
+        # Recorded input draws, set up on the first sample (see `_record_draws`)
+        self.record_draws = record_draws
+        self.num_draws = num_draws
+        self.draws = None
+        self.sample_count = 0
+
+        self.solver_backend_kind = solver_backend
+        self.solver_backend = (
+            make_solver_backend(solver_backend) if solver_backend is not None else None
+        )
+
+    def worker_spec(self):
+        """Return keyword arguments to build an equivalent LCA in another process."""
+        return {
+            "demand": {_as_key(k): v for k, v in self._initial_demand.items()},
+            "method": self.method,
+            "presamples": self.presamples_paths,
+            "methods": self.methods,
+            "max_guesses": self.max_guesses,
+            "preconditioner": self.preconditioner_kind,
+            "maxiter": self.maxiter,
+            "cache_dir": self.cache_dir,
+            "record_draws": self.record_draws,
+            "num_draws": self.num_draws,
+            "solver_backend": self.solver_backend_kind,
+        }
+
+    def load_data(self):
+        cache = MatrixCache(self.cache_dir) if self.cache_dir is not None else None
+        if cache is not None and cache.load(self):
+            # Matrices came from the cache: only the generators are needed
+            self.tech_rng = MCRandomNumberGenerator(self.tech_params, seed=self.seed)
+            self.bio_rng = MCRandomNumberGenerator(self.bio_params, seed=self.seed)
+            if self.lcia:
+                self.cf_rng = MCRandomNumberGenerator(self.cf_params, seed=self.seed)
+            if self.weighting:
+                self.load_weighting_data()
+                self.weighting_rng = MCRandomNumberGenerator(self.weighting_params, seed=self.seed)
+            if self.presamples:
+                self.presamples.index_arrays(self)
+        else:
+            super().load_data()
+            if cache is not None:
+                cache.save(self)
+        if self.preconditioner_kind is not None:
+            self.build_preconditioner(self.preconditioner_kind)
+
+    def build_preconditioner(self, kind="ilu", drop_tol=1e-5, fill_factor=10):
+        """Build a preconditioner from the current technosphere matrix.
+
+        Call this while the matrix holds the deterministic values (as it does
+        straight after loading) so the same preconditioner suits all samples.
+        `kind` is "ilu" for an incomplete LU factorization, or "lu" for a
+        complete one.
+        """
+        matrix = self.technosphere_matrix.tocsc()
+        if kind == "ilu":
+            factor = spilu(matrix, drop_tol=drop_tol, fill_factor=fill_factor)
+        elif kind == "lu":
+            factor = splu(matrix)
+        else:
+            raise ValueError(f"Unknown preconditioner: {kind}")
+        self.preconditioner = LinearOperator(matrix.shape, matvec=factor.solve)
+        return self.preconditioner
+
+    def _remember_guess(self, demand_sig, guess):
+        self.guesses[demand_sig] = guess
+        self.guesses.move_to_end(demand_sig)
+        while len(self.guesses) > self.max_guesses:
+            self.guesses.popitem(last=False)
+
+    def reseed(self, seed):
+        """Restart all the random number generators from `seed`.
+
+        This covers the technosphere, biosphere, characterization and
+        weighting generators, and the presamples index.
+        """
         if not hasattr(self, "tech_rng"):
             self.load_data()
-        self.rebuild_technosphere_matrix(self.tech_rng.next())
-        self.rebuild_biosphere_matrix(self.bio_rng.next())
+        self.seed = seed
+        self.tech_rng = MCRandomNumberGenerator(self.tech_params, seed=seed)
+        self.bio_rng = MCRandomNumberGenerator(self.bio_params, seed=seed)
         if self.lcia:
-            self.rebuild_characterization_matrix(self.cf_rng.next())
+            self.cf_rng = MCRandomNumberGenerator(self.cf_params, seed=seed)
         if self.weighting:
-            self.weighting_value = self.weighting_rng.next()
+            self.weighting_rng = MCRandomNumberGenerator(self.weighting_params, seed=seed)
+        self.method_rngs = self._method_rngs(seed)
+        if self.presamples and self.presamples_paths:
+            from presamples import PackagesDataLoader
+
+            self.presamples = PackagesDataLoader(self.presamples_paths, seed=seed, lca=self)
+            self.presamples.index_arrays(self)
+
+    def load_methods(self, methods):
+        """Prepare characterization matrices for all of `methods`.
+
+        After this, each new sample also draws characterization factors for
+        every method, and `characterization_matrices` lists the current
+        matrices in the same order as `methods`, so all the impact categories
+        can be scored from one inventory (see `ScoreGrouper.score_table`).
+        The main `method` of the LCA can be included; it shares the main
+        characterization matrix.
+        """
+        if not hasattr(self, "tech_rng"):
+            self.load_data()
+        self.methods = list(methods)
+        self.method_params = []
+        self.method_matrices = []
+        for method in self.methods:
+            params, matrix = build_characterization_matrix(self, method)
+            self.method_params.append(params)
+            self.method_matrices.append(matrix)
+        self.method_rngs = self._method_rngs(self.seed)
+
+    def _method_rngs(self, seed):
+        """Generators for `method_params`, with independent seeds spawned from `seed`.
+
+        Using `seed` itself for every method would give the same draws for
+        the flows which the methods share.
+        """
+        children = np.random.SeedSequence(seed).spawn(len(self.method_params))
+        return [
+            MCRandomNumberGenerator(params, seed=int(child.generate_state(1)[0]))
+            for params, child in zip(self.method_params, children)
+        ]
+
+    @property
+    def characterization_matrices(self):
+        """Current characterization matrices for `methods`."""
+        return [
+            self.characterization_matrix if method == self.method else matrix
+            for method, matrix in zip(self.methods, self.method_matrices)
+        ]
+
+    def rebuild_technosphere_matrix(self, vector):
+        super().rebuild_technosphere_matrix(vector)
+        # Any factorization left over from the previous sample is stale now
+        if hasattr(self, "solver"):
+            del self.solver
+        # Start counting for the new sample
+        self.solver_stats = _new_solver_stats()
+        self.solver_history.append(self.solver_stats)
+
+    def new_sample(self, factorize=False, iteration=None, record=True):
+        """Get new samples like __next__ but don't calculate anything.
+
+        If `factorize` is True, the new technosphere matrix is factorized
+        straight away, and the factorization is reused for every following
+        solve until the next sample is drawn.
+
+        `iteration` is the row where the draws are recorded, if
+        `record_draws` is set; by default samples are numbered in the order
+        they are drawn by this object. With `record=False` the draws are not
+        recorded (see `prepare_draws`).
+        """
+        if not hasattr(self, "tech_rng"):
+            with instrumentation.span("load data"):
+                self.load_data()
+        if iteration is None:
+            iteration = self.sample_count
+        if record:
+            self.sample_count = iteration + 1
+        with instrumentation.span("rebuild matrices"):
+            vectors = {"technosphere": self.tech_rng.next(), "biosphere": self.bio_rng.next()}
+            self.rebuild_technosphere_matrix(vectors["technosphere"])
+            self.rebuild_biosphere_matrix(vectors["biosphere"])
+            if self.lcia:
+                vectors["characterization"] = self.cf_rng.next()
+                self.rebuild_characterization_matrix(vectors["characterization"])
+            for i, method in enumerate(self.methods):
+                if method != self.method:
+                    self.method_matrices[i] = MatrixBuilder.build_diagonal_matrix(
+                        self.method_params[i], self._biosphere_dict, "row", "row",
+                        new_data=self.method_rngs[i].next()
+                    )
+            if self.weighting:
+                self.weighting_value = self.weighting_rng.next()
+        if self.record_draws is not None and self.draws is None:
+            before = {name: getattr(self, name).copy() for name in self.PRESAMPLED_MATRICES
+                      if hasattr(self, name)}
         if self.presamples:
-            self.presamples.update_matrices()
+            with instrumentation.span("presamples update"):
+                self.presamples.update_matrices()
+        if self.record_draws is not None:
+            if self.draws is None:
+                self._open_draws(before)
+            if record:
+                with instrumentation.span("record draws"):
+                    self._record_draws(iteration, vectors)
+        if factorize:
+            self.decompose_technosphere()
+
+    def prepare_draws(self):
+        """Create the store of recorded draws now, if it isn't open yet.
+
+        This draws a sample, without recording it, to find the presampled
+        entries. It is called before sharing samples out to worker
+        processes, so the store is created once, here, and the workers only
+        open it (see `attach_draws`).
+        """
+        if self.record_draws is not None and self.draws is None:
+            self.new_sample(record=False)
+
+    def attach_draws(self):
+        """Open the store of recorded draws made by `prepare_draws`."""
+        self.draws = InputDrawStore(self.record_draws)
+        self.draw_masks = {
+            group: mask for group, mask in self._draw_masks().items()
+            if group in self.draws.groups
+        }
+        self.presampled_entries = {
+            group[len("presamples "):] + "_matrix": tuple(self.draws.entries[group].T)
+            for group in self.draws.groups if group.startswith("presamples ")
+        }
+
+    def _draw_masks(self):
+        """The uncertain entries of each group: those with a distribution."""
+        return {
+            group: getattr(self, params_name)["uncertainty_type"] > 1
+            for group, (rng_name, params_name) in self.DRAW_GROUPS.items()
+            if hasattr(self, rng_name)
+        }
+
+    def _open_draws(self, before):
+        """Set up the store of recorded draws.
+
+        Presampled entries are found by comparing the matrices before and
+        after the first presamples update.
+        """
+        self.draw_masks = self._draw_masks()
+        entries = {}
+        for group, mask in self.draw_masks.items():
+            params = getattr(self, self.DRAW_GROUPS[group][1])
+            entries[group] = (params["row"][mask], params["col"][mask])
+        self.presampled_entries = {}
+        for name, matrix in before.items():
+            rows, cols = (getattr(self, name) - matrix).nonzero()
+            if len(rows):
+                self.presampled_entries[name] = (rows, cols)
+                entries["presamples " + name.replace("_matrix", "")] = (rows, cols)
+        if self.num_draws is None:
+            raise ValueError("`num_draws` is needed to record draws")
+        self.draws = InputDrawStore(self.record_draws, self.num_draws, entries)
+
+    def _record_draws(self, iteration, vectors):
+        values = {group: vectors[group][mask] for group, mask in self.draw_masks.items()}
+        for name, (rows, cols) in self.presampled_entries.items():
+            values["presamples " + name.replace("_matrix", "")] = np.asarray(
+                getattr(self, name)[rows, cols]
+            ).ravel()
+        self.draws.write(iteration, values)
+
+    def decompose_technosphere(self):
+        with instrumentation.span("factorize"):
+            if self.solver_backend is not None:
+                self.solver = self.solver_backend.factorize(self.technosphere_matrix)
+            else:
+                super().decompose_technosphere()
+        instrumentation.count("factorizations")
 
     def solve_linear_system(self):
+        # If the current sample has been factorized already, use that rather
+        # than solving (iteratively or from scratch) again
+        if hasattr(self, "solver"):
+            _log.debug("    Solve linear system: using factorization")
+            instrumentation.count("factorized solves")
+            with instrumentation.span("factorized solve"):
+                return self.solver(self.demand_array)
+
         demand_sig = tuple(self.demand.keys())
         _log.debug("    Solve linear system: %s", demand_sig)
         guess = self.guesses.get(demand_sig)
         if not self.iter_solver or guess is None:
             _log.debug("      solving from scratch...")
-            self.guesses[demand_sig] = guess = spsolve(
-                self.technosphere_matrix, self.demand_array
-            )
+            guess = self._direct_solve()
+            self._remember_guess(demand_sig, guess)
             _log.debug("      done")
             return guess
         else:
             _log.debug("      solving iteratively...")
-            solution, status = self.iter_solver(
-                self.technosphere_matrix,
-                self.demand_array,
-                x0=guess,
-                atol="legacy",
-                maxiter=1000,
-            )
+            stats = self.solver_stats
+
+            def count_iteration(xk):
+                stats["iterations"] += 1
+
+            with instrumentation.span("iterative solve"):
+                solution, status = self.iter_solver(
+                    self.technosphere_matrix,
+                    self.demand_array,
+                    x0=guess,
+                    M=self.preconditioner,
+                    callback=count_iteration,
+                    atol="legacy",
+                    maxiter=self.maxiter,
+                )
+            stats["iterative_solves"] += 1
+            instrumentation.count("iterative solves")
             _log.debug("      done (status %s)", status)
             if status != 0:
                 _log.debug("      solving again from scratch...")
-                self.guesses[demand_sig] = guess = spsolve(
-                    self.technosphere_matrix, self.demand_array
-                )
+                stats["fallbacks"] += 1
+                instrumentation.count("spsolve fallbacks")
+                solution = self._direct_solve()
                 _log.debug("      done")
-                return guess
-            else:
-                return solution
+            self._remember_guess(demand_sig, solution)
+            return solution
+
+    def _direct_solve(self):
+        self.solver_stats["direct_solves"] += 1
+        instrumentation.count("direct solves")
+        with instrumentation.span("direct solve"):
+            if self.solver_backend is not None:
+                return self.solver_backend.factorize(self.technosphere_matrix)(self.demand_array)
+            return spsolve(self.technosphere_matrix, self.demand_array)
+
+    @contextmanager
+    def scenario(self, scenario):
+        """Apply the edits in `scenario` (a `TechnosphereScenario`) temporarily.
+
+        The current sample must have been factorized. Within the block,
+        `technosphere_matrix` includes the edits, and `solver` solves the
+        edited system by a low-rank (Woodbury) update of the existing
+        factorization, so the scenario costs a few extra solves rather than a
+        new factorization, and uses the same random numbers as the baseline.
+        """
+        if not hasattr(self, "solver"):
+            raise ValueError("Factorize the technosphere matrix before applying a scenario")
+        base_matrix = self.technosphere_matrix
+        base_solver = self.solver
+        rows, cols, values = scenario.resolve(self)
+        delta = values - np.asarray(base_matrix[rows, cols]).ravel()
+
+        self.technosphere_matrix = (
+            base_matrix + sparse.csr_matrix((delta, (rows, cols)), shape=base_matrix.shape)
+        ).tocsr()
+        self.solver = WoodburySolver(base_solver, base_matrix.shape[0], rows, cols, delta)
+        try:
+            yield self
+        finally:
+            self.technosphere_matrix = base_matrix
+            self.solver = base_solver
+
+    def solver_summary(self):
+        """Return a DataFrame of solver counters, one row per sample."""
+        return pd.DataFrame(self.solver_history)
             
     
+    def label_draws(self, table):
+        """Add "input" and "output" activity keys to a `sensitivity_table`.
+
+        For characterization entries, both are the biosphere flow.
+        """
+        activities, products, flows = self.reverse_dict()
+        rows = {"technosphere": products, "biosphere": flows, "characterization": flows}
+        table = table.copy()
+        groups = table["group"].str.replace("presamples ", "")
+        table["input"] = [rows[g][r] for g, r in zip(groups, table["row"])]
+        table["output"] = [
+            flows[c] if g == "characterization" else activities[c]
+            for g, c in zip(groups, table["col"])
+        ]
+        return table
+
     def get_activity_indices(self, act_name):
         """Return a dictionary with the indices of all products that come from the specified database."""
-        indices = {}
-        label = 'Foreground'
-        
-        # Find activity keys that come from the specified database
-        for activity_key, activity_value in self.activity_dict.items():
-            if activity_key[1] == act_name:
-                activity_index = self.activity_dict.get(activity_key)
-                if activity_index is not None:
-                    # Store the activity index in the list corresponding to the label
-                    if label not in indices:
-                        indices[label] = []
-                    indices[label].append(activity_index)
-        
-        # Sort the indices within the list
-        indices[label].sort()
-        
-        return indices
+        # Matches on the activity code, via the index built once per LCA
+        return {'Foreground': sorted(activity_index(self).by_code.get(act_name, []))}
     
 
 
@@ -106,6 +969,8 @@ def recursive_calculation(
     level=0,
     max_level=3,
     cutoff=1e-2,
+    *,
+    trace=None,
 ):
     """Contribution analysis back through supply chain to `final_activities`.
 
@@ -121,119 +986,313 @@ def recursive_calculation(
     additional label "OTHER" if the activities in `final_activities` do not
     account for the full amount of the initial total score.
 
+    If `lca_obj` is given it must already have done the LCIA for
+    `lcia_method`. The work is done by `SupplyChainTraversal`; to analyse
+    several activities with the same LCA, create one of those and reuse it.
+    If `trace` is a list, a record of each visited node is appended to it.
+
+    `total_score` and `level` are deprecated: they were only needed by the
+    old recursive implementation. `total_score` is ignored (the total is
+    always the score of `activity`), and a non-zero `level` is taken off
+    `max_level`, as before.
+
     Adapted from bw2analyzer.utils.print_recursive_calculation.
 
     """
+    if total_score is not None or level:
+        warnings.warn(
+            "recursive_calculation: `total_score` and `level` are deprecated; "
+            "`total_score` is ignored and `level` only reduces `max_level`",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+    max_level -= level
     if lca_obj is None:
         _log.debug("  [initialising]")
         lca_obj = bc.LCA({activity: amount}, lcia_method)
         lca_obj.lci(factorize=True)
         lca_obj.lcia()
-        total_score = lca_obj.score
-        _log.debug("                 total score = %.2g", total_score)
-    elif total_score is None:
-        raise ValueError("Need total score and lca_obj")
-    else:
-        _log.debug("  [redo lcia] %s", activity)
-        lca_obj.redo_lcia({activity: amount})
-        if abs(lca_obj.score) <= abs(total_score * cutoff):
-            return {}
-
-    print("{:4.3f}{}{:4.3f} ({:06.4f}): {:.70}".format(amount,"  " * level, lca_obj.score / total_score, lca_obj.score, str(activity)))
-    print("{}                {}".format("  " * level, str(activity.key)))
-    if activity in final_activities:
-        label = final_activities[activity]
-        _log.debug("  [found] %s -> %s", activity, label)
-        print("{}  --> {}".format("  " * level, str(label)))
-        return {label: lca_obj.score}
-
-    # Otherwise, traverse further
-    result = {}
-    if level < max_level:
-        for exc in activity.technosphere():
-            new_result = recursive_calculation(
-                activity=exc.input,
-                final_activities=final_activities,
-                lcia_method=lcia_method,
-                lca_obj=lca_obj,
-                total_score=total_score,
-                amount=amount*exc["amount"],
-                level=level + 1,
-                max_level=max_level,
-                cutoff=cutoff,
-            )
-           
-            for k, v in new_result.items():
-                result[k] = result.get(k, 0) + v
-    else:
-        print("...max level...")
+    traversal = SupplyChainTraversal(lca_obj)
+    return traversal(
+        activity,
+        final_activities,
+        amount=amount,
+        max_level=max_level,
+        cutoff=cutoff,
+        trace=trace,
+    )
 
 
-    # If top level, calculate "other"
-    if level == 0:
-        #print(total_score)
-        num_expected_labels = len(set(final_activities.values()))
-        if len(result) != num_expected_labels:
-            _log.warning(
-                "Warning: only %d out of %d found", len(result), num_expected_labels
-            )
-        total_accounted_for = sum(result.values())
-        missing = total_score - total_accounted_for
-        #print(missing)
-        assert missing / total_score > -1e6, "missing should be nearly positive"
-        result["Total"] = total_score
-        if missing > 1e-6 * total_score:
-            result["OTHER"] = missing
-        
+def contributions_all_methods(demand, methods, final_activities, method_labels=None):
+    """Static contribution analysis of `demand` for all of `methods` at once.
 
-    return result
+    The inventory is solved once, all the characterization matrices are
+    stacked, and a DataFrame of scores (method x label) is returned. By
+    default methods are labelled by their second element, e.g. "climate
+    change".
 
+    Example::
 
-def sample_comparative_contribution(lca, demands, final_activities, **kwargs):
+        AMHTO_contribs = contributions_all_methods({AMHTO: 1}, my_methods, final_activities)
+    """
+    lca = bc.LCA(demand, methods[0])
+    lca.lci(factorize=True)
+    lca.lcia()
+    matrices = [lca.characterization_matrix] + [
+        build_characterization_matrix(lca, method)[1] for method in methods[1:]
+    ]
+    if method_labels is None:
+        method_labels = [method[1] for method in methods]
+    grouper = ScoreGrouper(lca, matrices)
+    return grouper.score_table(final_activities, method_labels)
+
+
+def sample_comparative_contribution(lca, demands, final_activities, factorize=True,
+                                    all_methods=False, scenarios=None, iteration=None,
+                                    inventory=None, group_inventory=None, **kwargs):
     """Draw a sample from `lca` and do contribution analysis.
 
     `lca` must be an instance of `MyMonteCarlo`, already prepared for LCIA
     calculations. Each time this function is called, the technosphere matrices
     are updated with a new Monte Carlo sample, and the LCIA calculations are
-    repeated for each of the demands in `demands`. For each,
-    `recursive_calculation` is called to calculate the contribution analysis
-    back to the activities in `final_activities`.
+    repeated for each of the demands in `demands`. For each, a `ScoreGrouper`
+    is used to calculate the contribution analysis back to the activities in
+    `final_activities`.
+
+    If `factorize` is True (the default), the technosphere matrix is
+    factorized once for the new sample, and the factorization is shared by
+    all the demands and the contribution analysis solves. Otherwise the
+    matrix is factorized again for each demand.
+
+    If `all_methods` is True, `lca.load_methods` must have been called, and
+    each result is a DataFrame of scores (method x component) for all the
+    methods, from the same inventory.
+
+    `scenarios` is an optional list of (TechnosphereScenario, demands) pairs.
+    After the results for `demands`, the results for each scenario's demands
+    are appended, calculated from the same sample with the scenario's edits
+    applied (see `MyMonteCarloLCA.scenario`).
 
+    `iteration` numbers the sample, for recording its input draws (see
+    `MyMonteCarloLCA.new_sample`), and for storing its per-activity results
+    in `inventory`, a `mc_results.InventoryStore`, and each group's
+    biosphere inventory in `group_inventory`, a
+    `rescoring.GroupInventoryStore`, if they are given.
     """
     # Update matrices from random number generator
     _log.debug("New sample...")
-    lca.new_sample()
+    lca.new_sample(factorize=factorize, iteration=iteration)
     _log.debug("done")
 
     # Do the calculation for each demand vector
     results = []
-    for demand in demands:
-        # This is not ideal, computationally, since we are using an
-        # iterative solver for the MC samples, then factorizing anyway
-        # for the contribution analysis...
-
-        if lca is None:
-            _log.debug("  [initialising]")
-            lca = bc.LCA({activity: amount}, lcia_method)
-            lca.lci(factorize=True)
-            lca.lcia()
-            total_score = lca.score
-        else:
+    inventories = []
+    group_inventories = []
+
+    def contributions(demand, new_system):
+        result, grouper = _demand_contributions(lca, demand, final_activities, all_methods)
+        results.append(result)
+        if inventory is not None:
+            inventories.append(_activity_inventory(lca, inventory, new_system))
+        if group_inventory is not None:
+            group_inventories.append(grouper.group_inventory(
+                group_inventory.indices(lca.biosphere_dict), group_inventory.components
+            ))
+
+    for i, demand in enumerate(demands):
+        if not factorize:
+            # This is not ideal, computationally, since we are using an
+            # iterative solver for the MC samples, then factorizing anyway
+            # for the contribution analysis...
             lca.decompose_technosphere()
+        contributions(demand, new_system=i == 0)
 
-            _log.debug("Contributions to %s", demand)
-            lca.redo_lci(demand)
-            lca.redo_lcia(demand)
+    # Alternative scenarios reuse the same sample and its factorization
+    for scenario, scenario_demands in scenarios or []:
+        if not factorize:
+            lca.decompose_technosphere()
+        with lca.scenario(scenario):
+            for i, demand in enumerate(scenario_demands):
+                contributions(demand, new_system=i == 0)
 
-            grouper = ScoreGrouper(lca)
-            contributions = grouper(final_activities)
-            results.append(contributions)
+    with instrumentation.span("store inventory"):
+        if inventory is not None:
+            inventory.write(iteration, *map(np.array, zip(*inventories)))
+        if group_inventory is not None:
+            group_inventory.write(iteration, np.array(group_inventories))
 
     return results
 
 
-import numpy as np
-import pandas as pd
+def _activity_inventory(lca, inventory, new_system):
+    """Supply, contribution and total score of the current demand for `inventory`.
+
+    The contribution of activity j is s_j A_jj u_j, where u are the unit
+    scores (see `unit_scores`). A_jj u_j only depends on the matrices, so it
+    is worked out again only when `new_system` is True, and kept on `lca`
+    for the following demands.
+    """
+    indices = inventory.indices(lca.activity_dict)
+    if new_system:
+        lca.activity_unit_scores = (
+            lca.technosphere_matrix.diagonal()[indices] * unit_scores(lca)[indices]
+        )
+    supply = lca.supply_array[indices]
+    return supply, supply * lca.activity_unit_scores, lca.score
+
+
+def _demand_contributions(lca, demand, final_activities, all_methods=False):
+    _log.debug("Contributions to %s", demand)
+    lca.redo_lcia(demand)
+
+    if all_methods:
+        grouper = ScoreGrouper(lca, lca.characterization_matrices)
+        return grouper.score_table(
+            final_activities, [method[1] for method in lca.methods]
+        ), grouper
+    grouper = ScoreGrouper(lca)
+    return grouper(final_activities), grouper
+
+
+def _activity_supply(lca, activity_labels):
+    """Return the total supply of the activities in `activity_labels`."""
+    if not activity_labels:
+        return None  # Handle the case where activity_labels is not provided
+    grouper = ScoreGrouper(lca)
+    group_indices = grouper.get_group_indices(activity_labels)
+    # Call solve_supply_subset for each group of indices
+    activity_supplies = {label: grouper.solve_supply_subset_test(indices) for label, indices in group_indices.items()}
+    # Sum the supply values for all activity labels
+    return sum(np.sum(supply_values) for supply_values in activity_supplies.values())
+
+
+def _contribution_rows(results, total_supply_value, iteration, method_label,
+                       demand_labels, component_order):
+    """Flatten the results of one sample into rows for the samples DataFrame.
+
+    Results for all methods (DataFrames from `ScoreGrouper.score_table`) give
+    one set of rows per method, labelled by method instead of `method_label`.
+    """
+    rows = []
+    for label, result in zip(demand_labels, results):
+        if isinstance(result, pd.DataFrame):
+            method_results = [(m, result.loc[m].to_dict()) for m in result.index]
+        else:
+            method_results = [(method_label, result)]
+        for method, method_result in method_results:
+            order = list(component_order) + [
+                k for k in method_result if k not in component_order
+            ]
+            for k in order:
+                rows.append([label, k, method, iteration, method_result.get(k, 0), total_supply_value])
+    return rows
+
+
+def block_seeds(seed, num_samples, block_size):
+    """Split `num_samples` iterations into blocks with independent seeds.
+
+    Returns a list of (start, stop, seed) tuples. The seeds are spawned from
+    `seed` with `np.random.SeedSequence`, so the streams do not overlap, and
+    they only depend on `seed` and `block_size` -- not on how the blocks are
+    later shared out between workers.
+    """
+    starts = range(0, num_samples, block_size)
+    children = np.random.SeedSequence(seed).spawn(len(starts))
+    return [
+        (start, min(start + block_size, num_samples), int(child.generate_state(1)[0]))
+        for start, child in zip(starts, children)
+    ]
+
+
+def _run_block(lca, block, demands, final_activities, activity_labels=None, **kwargs):
+    """Draw the samples for one block of iterations, after reseeding `lca`.
+
+    Returns a list of (iteration, results, activity supply) tuples.
+    """
+    start, stop, seed = block
+    lca.reseed(seed)
+    samples = []
+    for iteration in range(start, stop):
+        with instrumentation.iteration(iteration):
+            results = sample_comparative_contribution(
+                lca, demands, final_activities, iteration=iteration, **kwargs
+            )
+            samples.append((iteration, results, _activity_supply(lca, activity_labels)))
+    return samples
+
+
+# Each worker process builds its own LCA object once, and keeps it here
+_worker_lca = None
+
+
+def _init_worker(project, spec):
+    global _worker_lca
+    bw.projects.set_current(project)
+    methods = spec.pop("methods", None)
+    _worker_lca = MyMonteCarloLCA(**spec)
+    # Load the matrices and get the LCIA attributes in place
+    next(_worker_lca)
+    if methods:
+        _worker_lca.load_methods(methods)
+    if _worker_lca.record_draws is not None:
+        _worker_lca.attach_draws()
+
+
+def _run_block_in_worker(block, *args, **kwargs):
+    return _run_block(_worker_lca, block, *args, **kwargs)
+
+
+def _iter_samples(lca, demands, final_activities, num_samples, activity_labels,
+                  processes, seed, block_size, start, **kwargs):
+    """Yield (iteration, results, activity supply) for iterations from `start`."""
+    if processes is None and seed is None:
+        for iteration in range(start, num_samples):
+            with instrumentation.iteration(iteration):
+                results = sample_comparative_contribution(
+                    lca, demands, final_activities, iteration=iteration, **kwargs
+                )
+                total_supply_value = _activity_supply(lca, activity_labels)
+            yield iteration, results, total_supply_value
+        return
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        _log.info("Using random seed %s", seed)
+    # Blocks which are already complete can be skipped; a partly complete
+    # block is redrawn in full, to reach the same random state, but its
+    # iterations before `start` are dropped
+    blocks = [block for block in block_seeds(seed, num_samples, block_size)
+              if block[1] > start]
+
+    if processes is None:
+        for block in blocks:
+            samples = _run_block(lca, block, demands, final_activities, activity_labels, **kwargs)
+            yield from (sample for sample in samples if sample[0] >= start)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Activities are passed by key so they can be sent to the workers
+    demands = [{_as_key(k): v for k, v in demand.items()} for demand in demands]
+    lca.prepare_draws()
+    if kwargs.get("scenarios"):
+        kwargs["scenarios"] = [
+            (scenario, [{_as_key(k): v for k, v in demand.items()} for demand in scenario_demands])
+            for scenario, scenario_demands in kwargs["scenarios"]
+        ]
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(bw.projects.current, lca.worker_spec()),
+    ) as executor:
+        futures = [
+            executor.submit(_run_block_in_worker, block, demands, final_activities,
+                            activity_labels, **kwargs)
+            for block in blocks
+        ]
+        for future in futures:
+            yield from (sample for sample in future.result() if sample[0] >= start)
+
 
 def collect_contribution_samples(
     lca,
@@ -244,55 +1303,457 @@ def collect_contribution_samples(
     demand_labels,
     component_order,
     activity_labels=None,  # Set default value to None
+    processes=None,
+    seed=None,
+    block_size=50,
+    sink=None,
+    scenarios=None,
+    baseline_label="Current",
+    accumulator=None,
+    start=0,
     **kwargs
     ):
     """Repeatedly call `sample_comparative_contribution` and collect results in
-    a DataFrame, including quantities of specified processes."""
-    samples = []
-    
-    for iteration in range(num_samples):
-        results = sample_comparative_contribution(
-            lca, demands, final_activities, **kwargs
-        )
-        
-        if activity_labels:
-            grouper = ScoreGrouper(lca)
-            group_indices = grouper.get_group_indices(activity_labels)
-            # Call solve_supply_subset for each group of indices
-            activity_supplies = {label: grouper.solve_supply_subset_test(indices) for label, indices in group_indices.items()}
-        else:
-            activity_supplies = {}
+    a DataFrame, including quantities of specified processes.
 
-        for label, result in zip(demand_labels, results):
-            order = list(component_order) + [
-                k for k in result if k not in component_order
-            ]
+    By default the samples are drawn one after another from `lca`. If `seed`
+    is given, the iterations are split into blocks of `block_size`, and
+    the random number generators are reseeded from `seed` at the start of
+    each block (see `block_seeds`). If `processes` is given, the blocks are
+    shared out over a pool of that many worker processes, each of which
+    builds its own copy of `lca` once. A given `seed` and `block_size` give
+    the same samples whatever the number of processes.
 
-            for k in order:
-                row = [label, k, method_label, iteration, result.get(k, 0)]
-                
-                if activity_labels:
-                    # Sum the supply values for all activity labels
-                    total_supply_value = sum(np.sum(supply_values) for supply_values in activity_supplies.values())
-                    row.append(total_supply_value)
-                else:
-                    row.append(None)  # Handle the case where activity_labels is not provided
-                
-                samples.append(row)
+    If `sink` is given (a `mc_results.ContributionSampleSink`), results are
+    stored in its arrays and flushed to disk as sampling proceeds, and
+    sampling resumes after the iterations already completed in the sink.
+    With a `seed`, a resumed run gives the same samples as an uninterrupted
+    one.
+
+    `scenarios` is an optional dictionary {energy_scenario: (scenario,
+    demands, demand_labels)}, where `scenario` is a `TechnosphereScenario`.
+    Each one is evaluated on the same samples as the baseline (see
+    `sample_comparative_contribution`), and an "energy_scenario" column is
+    added, with `baseline_label` for the baseline results.
+
+    If `accumulator` is given (a `mc_results.StatisticsAccumulator`), each
+    iteration's results are also added to it as they are sampled.
+
+    If `inventory` is given (a `mc_results.InventoryStore`), each activity's
+    supply and contribution are stored too, so the samples can be grouped
+    by a different mapping later with `mc_results.regroup_contributions`.
+    Likewise `group_inventory` (a `rescoring.GroupInventoryStore`) stores
+    each group's biosphere inventory, to score other characterization
+    factors later with `rescoring.rescore`.
+
+    `start` skips the first iterations, to extend an earlier run up to
+    `num_samples` (as `collect_until_converged` does).
+    """
+    if scenarios:
+        if sink is not None:
+            raise ValueError("Scenarios can't be stored in a sink yet")
+        kwargs["scenarios"] = [
+            (scenario, scenario_demands)
+            for scenario, scenario_demands, _ in scenarios.values()
+        ]
+        demand_labels = [(label, baseline_label) for label in demand_labels] + [
+            (label, energy_scenario)
+            for energy_scenario, (_, _, scenario_labels) in scenarios.items()
+            for label in scenario_labels
+        ]
+
+    if sink is not None:
+        start = max(start, sink.num_completed)
+    samples = _iter_samples(
+        lca, demands, final_activities, num_samples, activity_labels,
+        processes, seed, block_size, start, **kwargs
+    )
+
+    if accumulator is not None:
+        samples = _accumulate(samples, accumulator, demand_labels, baseline_label)
+
+    if sink is not None:
+        for iteration, results, total_supply_value in samples:
+            sink.add(iteration, results, total_supply_value)
+        return sink.to_dataframe()
+
+    rows = []
+    for iteration, results, total_supply_value in samples:
+        rows.extend(_contribution_rows(
+            results, total_supply_value, iteration, method_label,
+            demand_labels, component_order
+        ))
 
     # Define columns
     columns = ["scenario", "component", "method", "iteration", "score", "activity labels"]
     
     # Create DataFrame
-    return pd.DataFrame(samples, columns=columns)
+    with instrumentation.span("DataFrame assembly"):
+        df = pd.DataFrame(rows, columns=columns)
+        if scenarios:
+            df["energy_scenario"] = [label[1] for label in df["scenario"]]
+            df["scenario"] = [label[0] for label in df["scenario"]]
+    return df
+
+
+def unit_scores(lca_obj):
+    """Cumulative score per unit of each product: solve A^T u = c B.
+
+    Uses the current factorization, if it can solve the transposed system
+    (see `SolverBackend`).
+    """
+    characterized_biosphere = np.array(
+        (lca_obj.characterization_matrix * lca_obj.biosphere_matrix).sum(axis=0)
+    ).ravel()
+    transpose_solve = getattr(getattr(lca_obj, "solver", None), "transpose_solve", None)
+    if transpose_solve is not None:
+        return transpose_solve(characterized_biosphere)
+    return spsolve(lca_obj.technosphere_matrix.T.tocsc(), characterized_biosphere)
+
+
+class SupplyChainTraversal:
+    """Traverse the supply chain of `lca_obj` back to labelled activities.
+
+    The LCIA score is linear in the amount demanded, so the cumulative score
+    of one unit of every product is found up front by a single (transposed)
+    solve, and each node visited in the traversal only needs a lookup. Nodes
+    are expanded a whole level at a time using the technosphere matrix
+    directly, without going back to the database.
+
+    One instance can be reused for any number of starting activities.
+    """
+
+    def __init__(self, lca_obj):
+        self.lca_obj = lca_obj
+        self.technosphere = lca_obj.technosphere_matrix.tocsc()
+
+        # Column (activity) producing each row (product)
+        self.col_of_row = np.full(len(lca_obj.product_dict), -1)
+        for key, row in lca_obj.product_dict.items():
+            self.col_of_row[row] = lca_obj.activity_dict.get(key, -1)
+        rows = np.flatnonzero(self.col_of_row >= 0)
+        self.production = np.ones(len(self.col_of_row))
+        self.production[rows] = np.asarray(
+            self.technosphere[rows, self.col_of_row[rows]]
+        ).ravel()
+
+        self.unit_scores = unit_scores(lca_obj)
+
+    def _expand(self, rows, amounts):
+        """Return the (rows, amounts) of the inputs to the products `rows`."""
+        cols = self.col_of_row[rows]
+        has_col = cols >= 0
+        rows, amounts, cols = rows[has_col], amounts[has_col], cols[has_col]
+
+        indptr = self.technosphere.indptr
+        counts = indptr[cols + 1] - indptr[cols]
+        offsets = np.repeat(indptr[cols] - np.cumsum(counts) + counts, counts)
+        entries = offsets + np.arange(counts.sum())
+
+        parent_rows = np.repeat(rows, counts)
+        activity_level = np.repeat(amounts / self.production[rows], counts)
+        input_rows = self.technosphere.indices[entries]
+        input_amounts = -self.technosphere.data[entries] * activity_level
+
+        # Skip the reference product itself and empty entries
+        keep = (input_rows != parent_rows) & (input_amounts != 0)
+        return input_rows[keep], input_amounts[keep]
+
+    def _record(self, trace, level, rows, amounts, scores, total_score, labels, label_list):
+        _, reverse_product_dict, _ = self.lca_obj.reverse_dict()
+        for row, amount, score, label in zip(rows, amounts, scores, labels):
+            trace.append({
+                "level": level,
+                "activity": reverse_product_dict[row],
+                "amount": amount,
+                "score": score,
+                "fraction": score / total_score if total_score else np.nan,
+                "label": label_list[label] if label >= 0 else None,
+            })
+
+    def __call__(self, activity, final_activities, amount=1, max_level=3,
+                 cutoff=1e-2, trace=None):
+        """Return {label: score, ...} for `amount` of `activity`.
+
+        See `recursive_calculation` for the meaning of the arguments and the
+        result.
+        """
+        product_dict = self.lca_obj.product_dict
+        label_list = list(dict.fromkeys(final_activities.values()))
+        label_index = {label: i for i, label in enumerate(label_list)}
+        label_of_row = np.full(len(self.col_of_row), -1)
+        for key, label in final_activities.items():
+            key = _as_key(key)
+            if key in product_dict:
+                label_of_row[product_dict[key]] = label_index[label]
+
+        rows = np.array([product_dict[_as_key(activity)]])
+        amounts = np.array([float(amount)])
+        total_score = float(amount * self.unit_scores[rows[0]])
+        _log.debug("                 total score = %.2g", total_score)
+
+        totals = np.zeros(len(label_list))
+        found_any = np.zeros(len(label_list), dtype=bool)
+        for level in range(max_level + 1):
+            scores = amounts * self.unit_scores[rows]
+            if level > 0:
+                keep = np.abs(scores) > abs(total_score * cutoff)
+                rows, amounts, scores = rows[keep], amounts[keep], scores[keep]
+            labels = label_of_row[rows]
+            if trace is not None:
+                self._record(trace, level, rows, amounts, scores, total_score, labels, label_list)
+
+            found = labels >= 0
+            np.add.at(totals, labels[found], scores[found])
+            found_any[labels[found]] = True
+            if level == 0 and found.any():
+                return {label_list[labels[0]]: total_score}
+
+            rows, amounts = rows[~found], amounts[~found]
+            if level == max_level or len(rows) == 0:
+                break
+            rows, amounts = self._expand(rows, amounts)
+        if len(rows):
+            _log.debug("  %d nodes not expanded at max level", len(rows))
+
+        result = {label_list[i]: float(totals[i]) for i in np.flatnonzero(found_any)}
+
+        # Top level, so calculate "other"
+        num_expected_labels = len(label_list)
+        if len(result) != num_expected_labels:
+            _log.warning(
+                "Warning: only %d out of %d found", len(result), num_expected_labels
+            )
+        total_accounted_for = sum(result.values())
+        missing = total_score - total_accounted_for
+        assert missing / total_score > -1e6, "missing should be nearly positive"
+        result["Total"] = total_score
+        if missing > 1e-6 * total_score:
+            result["OTHER"] = missing
+
+        return result
 
 
+def collect_until_converged(
+    lca,
+    demands,
+    final_activities,
+    method_label,
+    demand_labels,
+    component_order,
+    targets,
+    batch_size=100,
+    min_samples=200,
+    max_samples=5000,
+    ratios=True,
+    relative=True,
+    **kwargs
+    ):
+    """Call `collect_contribution_samples` in batches until the statistics converge.
+
+    After each batch of `batch_size` iterations (and at least `min_samples`),
+    the precision of the quartiles of the totals and, if `ratios` is True, of
+    the ratios to the reference scenario is estimated by a
+    `mc_results.ConvergenceMonitor` with `targets` (e.g. {"median": 0.005}).
+    Sampling stops once all of them are within target, or at `max_samples`.
+    Other arguments are passed on to `collect_contribution_samples`; with a
+    `seed`, the samples are the same as a fixed-size run of the same length.
+
+    Returns (samples, precision), where `precision` is the DataFrame from the
+    last convergence check. With a `sink`, `samples` are all the completed
+    iterations in the sink.
+    """
+    accumulator = kwargs.pop("accumulator", None) or StatisticsAccumulator()
+    monitor = ConvergenceMonitor(targets, relative=relative)
+    batches = []
+    num_samples = 0
+    while True:
+        start, num_samples = num_samples, min(num_samples + batch_size, max_samples)
+        batches.append(collect_contribution_samples(
+            lca, demands, final_activities, num_samples, method_label,
+            demand_labels, component_order, accumulator=accumulator,
+            start=start, **kwargs
+        ))
+        if num_samples < min_samples:
+            continue
+        precision = monitor.check(accumulator_series(accumulator, ratios=ratios))
+        _log.info("%d samples: %d of %d statistics converged", num_samples,
+                  precision["converged"].sum(), len(precision))
+        if monitor.converged(precision) or num_samples >= max_samples:
+            break
+    if kwargs.get("sink") is not None:
+        # Each batch returns everything in the sink so far
+        return batches[-1], precision
+    return pd.concat(batches, ignore_index=True), precision
+
+
+def sample_reference_flows(lca, flows, num_samples, out=None, targets=None,
+                           batch_size=100, min_samples=200):
+    """Score each of `flows` against the same Monte Carlo samples.
+
+    `lca` is a `MyMonteCarloLCA` whose demand includes all of `flows` (so
+    they are all in its matrices), e.g.
+    ``MyMonteCarloLCA({flow: 1 for flow in flows}, method)``. For each
+    sample the technosphere is factorized once, one unit of every flow is
+    solved for as a multi-column system, and the scores are written into
+    `out`, a (sample x flow) array which is allocated if not given. The
+    samples are paired across flows.
+
+    If `targets` are given, sampling stops early once the quartiles of every
+    flow have converged (see `mc_results.ConvergenceMonitor`), checking every
+    `batch_size` samples after `min_samples`. Returns (scores, precision),
+    where `scores` has the samples actually drawn and `precision` is None
+    without `targets`.
+    """
+    if out is None:
+        out = np.empty((num_samples, len(flows)))
+    monitor = ConvergenceMonitor(targets) if targets else None
+    precision = None
+    demands = None
+    done = 0
+    for i in range(num_samples):
+        lca.new_sample(factorize=True)
+        if demands is None:
+            # One unit of each flow, as the columns of one demand matrix
+            rows = [lca.product_dict[_as_key(flow)] for flow in flows]
+            demands = sparse.csc_matrix(
+                (np.ones(len(rows)), (rows, np.arange(len(rows)))),
+                shape=(lca.technosphere_matrix.shape[0], len(rows)),
+            )
+        characterized_biosphere = np.array(
+            (lca.characterization_matrix * lca.biosphere_matrix).sum(axis=0)
+        ).ravel()
+        out[i] = characterized_biosphere @ solve_many(lca.solver, demands)
+
+        done = i + 1
+        if monitor is not None and done >= min_samples and done % batch_size == 0:
+            precision = monitor.check({j: out[:done, j] for j in range(len(flows))})
+            if monitor.converged(precision):
+                break
+    return out[:done], precision
+
+
+def reference_flow_samples(lca, flows, num_samples, **kwargs):
+    """Like `sample_reference_flows`, but for {label: flow}, as a DataFrame.
+
+    The DataFrame has "material" and "score" columns, with all the samples
+    for each label in turn, like `results/metal_gwp.csv`.
+
+    Example::
+
+        materials = {"CoCr": CoCr, "Ti6Al4V_workpiece": Ti6Al4V_workpiece}
+        lca = MyMonteCarloLCA({flow: 1 for flow in materials.values()}, method)
+        df, _ = reference_flow_samples(lca, materials, 1000)
+    """
+    labels = list(flows)
+    scores, precision = sample_reference_flows(lca, list(flows.values()), num_samples, **kwargs)
+    df = pd.DataFrame({
+        "material": np.repeat(labels, len(scores)),
+        "score": scores.T.ravel(),
+    })
+    if precision is not None:
+        precision["series"] = [labels[j] for j in precision["series"]]
+    return df, precision
+
+
+def _accumulate(samples, accumulator, demand_labels, baseline_label):
+    for iteration, results, total_supply_value in samples:
+        accumulator.add(iteration, demand_labels, results, energy_scenario=baseline_label)
+        yield iteration, results, total_supply_value
+
+
+def _as_key(activity):
+    """Return the (database, code) key of an activity, or `activity` if it is already a key."""
+    return getattr(activity, "key", activity)
+
+
+class ActivityIndex:
+    """Lookups of matrix indices by database or code, built once per LCA."""
+
+    def __init__(self, lca_obj):
+        self.activity_dict = lca_obj.activity_dict
+        self.by_database = {}
+        self.by_code = {}
+        for (database, code), index in self.activity_dict.items():
+            self.by_database.setdefault(database, []).append(index)
+            self.by_code.setdefault(code, []).append(index)
+
+
+def activity_index(lca_obj):
+    """Return the `ActivityIndex` of `lca_obj`, building it the first time."""
+    index = getattr(lca_obj, "_activity_index", None)
+    if index is None or index.activity_dict is not lca_obj.activity_dict:
+        index = lca_obj._activity_index = ActivityIndex(lca_obj)
+    return index
+
+
+class ActivityMapping:
+    """A {activity: label} mapping compiled against the matrices of an LCA.
+
+    Holds the matrix indices for each label, and a sparse (label x activity)
+    indicator matrix, so that the demands of all the groups can be built in
+    one sparse product. Keys which are not in the LCA are listed in
+    `missing` and logged when the mapping is built; with `strict=True` they
+    raise a KeyError instead.
+
+    Use `compile_activity_labels` to reuse the compiled mapping for the same
+    LCA and the same labels.
+    """
+
+    def __init__(self, lca_obj, activity_labels, strict=False):
+        activity_dict = lca_obj.activity_dict
+        self.group_indices = {}
+        self.missing = []
+        seen_keys = {}
+        for key, label in activity_labels.items():
+            key = _as_key(key)
+            if key in seen_keys:
+                raise ValueError(f"Key {key} ({label}) already mapped to {seen_keys[key]}")
+            seen_keys[key] = label
+            indices = self.group_indices.setdefault(label, [])
+            if key in activity_dict:
+                indices.append(activity_dict[key])
+            else:
+                self.missing.append((key, label))
+        if self.missing:
+            if strict:
+                raise KeyError(f"Activities not in LCA: {self.missing}")
+            _log.warning("%d mapped activities are not in the LCA: %s",
+                         len(self.missing), self.missing)
+
+        self.labels = list(self.group_indices)
+        rows = [i for i, label in enumerate(self.labels) for _ in self.group_indices[label]]
+        cols = [index for label in self.labels for index in self.group_indices[label]]
+        self.indicator = sparse.csr_matrix(
+            (np.ones(len(cols)), (rows, cols)),
+            shape=(len(self.labels), len(activity_dict)),
+        )
+
+    def demand_matrix(self, demand_per_activity):
+        """Return sparse (activity x label) demands, one column per label."""
+        return self.indicator.multiply(demand_per_activity[None, :]).T.tocsc()
+
+
+def compile_activity_labels(lca_obj, activity_labels, strict=False):
+    """Return an `ActivityMapping`, reusing the one built before for this LCA.
+
+    The compiled mappings are looked up by the contents of `activity_labels`,
+    so changing the labels in place gives a new mapping.
+    """
+    cache = getattr(lca_obj, "_compiled_mappings", None)
+    if cache is None or cache[0] is not lca_obj.activity_dict:
+        cache = lca_obj._compiled_mappings = (lca_obj.activity_dict, {})
+    key = (frozenset((_as_key(k), label) for k, label in activity_labels.items()), strict)
+    mapping = cache[1].get(key)
+    if mapping is None:
+        mapping = cache[1][key] = ActivityMapping(lca_obj, activity_labels, strict)
+    return mapping
 
 
 class ScoreGrouper:
     """Allocate LCIA score to groups of processes."""
     
-    def __init__(self, lca_obj):
+    def __init__(self, lca_obj, characterization_matrices=None):
         self.lca_obj = lca_obj
 
         # First get the score per process activity, which is constant and
@@ -301,26 +1762,33 @@ class ScoreGrouper:
             (lca_obj.characterization_matrix * lca_obj.biosphere_matrix)
             .sum(axis=0)
         ).ravel()
+
+        # Optionally, the same for several methods at once: stack the
+        # characterization factors (method x flow) so all methods are scored
+        # by one product
+        if characterization_matrices is not None:
+            cfs = sparse.csr_matrix(np.vstack([
+                matrix.diagonal() for matrix in characterization_matrices
+            ]))
+            self.method_biosphere = (cfs @ lca_obj.biosphere_matrix).toarray()
+        else:
+            self.method_biosphere = None
+        self.method_scores = {}
+
+        # Technosphere coefficients of the reference products, used to turn
+        # supply back into demand
+        self.technosphere_diagonal = lca_obj.technosphere_matrix.diagonal()
         
         # Track the part of the supply (process activity) which has been
         # "used" so far
         self.used_supply = np.zeros_like(lca_obj.supply_array)
         self.used_indices = set()
+        self.supply_subsets = {}
         
     def get_group_indices(self, activity_labels):
         """Return {label: indices} from input {activity_key: label}"""
-        indices = {}
-        seen_keys = {}
-        for key, label in activity_labels.items():
-            if key in seen_keys:
-                raise ValueError(f"Key {key} ({label}) already mapped to {seen_keys[key]}")
-            seen_keys[key] = label
-            if label not in indices:
-                indices[label] = []
-            if key in self.lca_obj.activity_dict:
-                index = self.lca_obj.activity_dict[key]
-                indices[label].append(index)
-        return indices
+        mapping = compile_activity_labels(self.lca_obj, activity_labels)
+        return {label: list(indices) for label, indices in mapping.group_indices.items()}
 
     def solve_supply_subset(self, indices):
         """Solve the process activity (supply) driven by only `indices`.
@@ -331,7 +1799,7 @@ class ScoreGrouper:
         demand = np.zeros(len(self.lca_obj.supply_array))
         demand[indices] = (
             self.lca_obj.supply_array[indices] *
-            self.lca_obj.technosphere_matrix.diagonal()[indices]
+            self.technosphere_diagonal[indices]
         )
         
         # Solve for this subset of demand
@@ -339,6 +1807,31 @@ class ScoreGrouper:
         
         return supply_subset
     
+    def group_demand_matrix(self, group_indices):
+        """Return sparse demand matrix with one column per group of indices.
+
+        `group_indices` is a list of lists of indices. Column `j` is the demand
+        that `solve_supply_subset` would build for `group_indices[j]`.
+        """
+        rows = [np.asarray(indices, dtype=int) for indices in group_indices]
+        cols = [np.full(len(r), j) for j, r in enumerate(rows)]
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+        values = self.lca_obj.supply_array[rows] * self.technosphere_diagonal[rows]
+        return sparse.csc_matrix(
+            (values, (rows, cols)),
+            shape=(len(self.lca_obj.supply_array), len(group_indices)),
+        )
+
+    def solve_supply_subsets(self, group_indices):
+        """Solve the supply driven by each group of indices in one go.
+
+        Returns an array with one column per entry in `group_indices`, solved
+        together against the current factorization.
+        """
+        demands = self.group_demand_matrix(group_indices)
+        return solve_many(self.lca_obj.solver, demands)
+
     def solve_supply_subset_test(self, indices):
         """Solve the process activity (supply) driven by only `indices`.
         
@@ -389,6 +1882,68 @@ class ScoreGrouper:
         score = self.calc_score(supply_subset)
         return score
     
+    def get_cumulative_scores(self, group_indices, demands=None):
+        """Return cumulative scores for all groups in `group_indices` at once.
+
+        `group_indices` is a dictionary {label: indices}, as returned by
+        `get_group_indices`. Equivalent to calling `get_cumulative_score` for
+        each label in turn, but all the groups are solved together and scored
+        with a single matrix product. `demands` can give the matrix of group
+        demands, if already built (see `ActivityMapping.demand_matrix`).
+        """
+        for indices in group_indices.values():
+            indices_already_used = self.used_indices & set(indices)
+            if indices_already_used:
+                raise ValueError(f"Already got score for processes: {indices_already_used}")
+            self.used_indices.update(indices)
+
+        labels = list(group_indices)
+        if demands is None:
+            demands = self.group_demand_matrix([group_indices[label] for label in labels])
+        instrumentation.count("grouper labels", len(labels))
+        with instrumentation.span("grouper solves"):
+            supply_subsets = solve_many(self.lca_obj.solver, demands)
+        self.used_supply += supply_subsets.sum(axis=1)
+        # Kept so the groups' inventories can be stored (see `group_inventory`)
+        self.supply_subsets = dict(zip(labels, supply_subsets.T))
+
+        if self.method_biosphere is not None:
+            method_scores = self.method_biosphere @ supply_subsets
+            self.method_scores.update(zip(labels, method_scores.T))
+
+        scores = self.characterized_biosphere @ supply_subsets
+        return {label: float(score) for label, score in zip(labels, scores)}
+
+    def group_inventory(self, flow_indices, labels):
+        """Biosphere inventory (label x flow) of the groups scored so far.
+
+        Rows follow `labels`, and are zero for labels which have not been
+        scored; columns are the biosphere rows `flow_indices`.
+        """
+        inventory = np.zeros((len(labels), len(flow_indices)))
+        scored = [label for label in labels if label in self.supply_subsets]
+        if scored:
+            supply = np.column_stack([self.supply_subsets[label] for label in scored])
+            rows = [labels.index(label) for label in scored]
+            inventory[rows] = (self.lca_obj.biosphere_matrix[flow_indices] @ supply).T
+        return inventory
+
+    def score_table(self, activity_labels, method_labels=None):
+        """Return a DataFrame of scores (method x label) for all methods.
+
+        Needs `characterization_matrices` to have been given. The inventory is
+        solved once for each group, and every method is scored from it.
+        """
+        if self.method_biosphere is None:
+            raise ValueError("ScoreGrouper was created without characterization_matrices")
+        mapping = compile_activity_labels(self.lca_obj, activity_labels)
+        self.get_cumulative_scores(mapping.group_indices, self.mapping_demands(mapping))
+        group_indices = mapping.group_indices
+        return pd.DataFrame(
+            {label: self.method_scores[label] for label in group_indices},
+            index=method_labels,
+        )
+
     def residual_score(self):
         """Calculate residual LCIA score for processes which have not yet been reported."""
         # Solve for remaining activities which have not been reported separately
@@ -397,11 +1952,16 @@ class ScoreGrouper:
     
         
             
-    def residual_activities(self, include_databases=None, exclude_databases=None):
+    def residual_activities(self, include_databases=None, exclude_databases=None,
+                            max_memory=256e6):
         """Report which activities are contributing to the residual score.
         
         If `include_databases` is given, only include activities from those databases.
         Activities from any databases in `exclude_databases` are ignored.
+
+        The unit demands of all the selected activities are solved together,
+        as multi-column systems of as many columns as fit in `max_memory`
+        bytes.
         
         Example::
         
@@ -414,23 +1974,26 @@ class ScoreGrouper:
         
         if exclude_databases is None:
             exclude_databases = set()
-        all_indices = (i for i in range(len(self.lca_obj.supply_array)))
+        num_activities = len(self.lca_obj.supply_array)
+        databases = np.array([adict[i][0] for i in range(num_activities)], dtype=object)
+        selected = ~np.isin(databases, list(exclude_databases))
         if include_databases is not None:
-            foreground_indices = [i for i in all_indices
-                                  if adict[i][0] in include_databases and adict[i][0] not in exclude_databases]
-        else:
-            foreground_indices = [i for i in all_indices
-                                  if adict[i][0] not in exclude_databases]
-        
+            selected &= np.isin(databases, list(include_databases))
+        foreground_indices = np.flatnonzero(selected)
+
+        supply = self.lca_obj.supply_array[:, None]
+        used_supply = self.used_supply[:, None]
+        chunk_size = max(1, int(max_memory // (8 * num_activities)))
         results = []
-        for i in foreground_indices:
-            solution = self.solve_supply_subset([i])
-            # Clip solution to only include parts that we haven't reported already
-            excess = np.maximum(0, (self.used_supply + solution) - self.lca_obj.supply_array)
-            solution -= excess
-            score = self.calc_score(solution)
-            if abs(score) > 1e-4:
-                results.append((adict[i], score))
+        for start in range(0, len(foreground_indices), chunk_size):
+            indices = foreground_indices[start:start + chunk_size]
+            solutions = self.solve_supply_subsets([[i] for i in indices])
+            # Clip solutions to only include parts that we haven't reported already
+            excess = np.maximum(0, (used_supply + solutions) - supply)
+            solutions -= excess
+            scores = self.characterized_biosphere @ solutions
+            keep = np.abs(scores) > 1e-4
+            results.extend((adict[i], float(score)) for i, score in zip(indices[keep], scores[keep]))
 
         results = sorted(results, key=lambda x: x[1], reverse=True)
         return results
@@ -438,12 +2001,13 @@ class ScoreGrouper:
    
         
             
+    def mapping_demands(self, mapping):
+        """Demands for all the groups of an `ActivityMapping`, in one product."""
+        return mapping.demand_matrix(self.lca_obj.supply_array * self.technosphere_diagonal)
+
     def __call__(self, activity_labels):
-        group_indices = self.get_group_indices(activity_labels)
-        scores = {
-            label: self.get_cumulative_score(indices)
-            for label, indices in group_indices.items()
-        }
+        mapping = compile_activity_labels(self.lca_obj, activity_labels)
+        scores = self.get_cumulative_scores(mapping.group_indices, self.mapping_demands(mapping))
         #residual = self.residual_score()
         #if abs(residual) > abs(np.array(list(scores.values()))).max() * 1e-3:
         #    scores["OTHER"] = residual 
@@ -0,0 +1,106 @@
+"""Timing spans and counters for the Monte Carlo contribution pipeline.
+
+Instrumentation is off by default, and then a span is a shared no-op
+context manager, so the hooks in `bw_helpers` cost next to nothing. Turn it
+on to see where the time in a run goes::
+
+    from instrumentation import instrumentation
+    instrumentation.enable()
+    samples = collect_contribution_samples(...)
+    records = instrumentation.records()   # one row per iteration
+    instrumentation.summary()             # totals per stage
+
+Spans and counters are attributed to the current iteration (see
+`iteration`); anything outside an iteration is collected under iteration
+None. Runs in worker processes are recorded in those processes, not here.
+"""
+
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Instrumentation:
+    """Collect per-iteration stage timings and counters, when enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._records = []
+        self._current = self._new_record(None)
+
+    @staticmethod
+    def _new_record(iteration):
+        return {"iteration": iteration, "times": {}, "counts": {}}
+
+    def span(self, name):
+        """Context manager timing the stage `name`."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            times = self._current["times"]
+            times[name] = times.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        """Add `n` to the counter `name`."""
+        if self.enabled:
+            counts = self._current["counts"]
+            counts[name] = counts.get(name, 0) + n
+
+    def iteration(self, iteration):
+        """Context manager attributing spans and counters to `iteration`."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._iteration(iteration)
+
+    @contextmanager
+    def _iteration(self, iteration):
+        outer = self._current
+        self._current = self._new_record(iteration)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current["times"]["iteration"] = time.perf_counter() - start
+            self._records.append(self._current)
+            self._current = outer
+
+    def records(self):
+        """Return a DataFrame with one row per iteration.
+
+        Columns are "time: <stage>" in seconds and "count: <counter>".
+        """
+        records = self._records + ([self._current] if self._current["times"] or self._current["counts"] else [])
+        return pd.DataFrame([
+            {
+                "iteration": record["iteration"],
+                **{f"time: {k}": v for k, v in record["times"].items()},
+                **{f"count: {k}": v for k, v in record["counts"].items()},
+            }
+            for record in records
+        ])
+
+    def summary(self):
+        """Return the totals of each time and counter over all iterations."""
+        return self.records().drop(columns="iteration").sum()
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,675 @@
+"""Storage for Monte Carlo contribution samples.
+
+Samples are held in preallocated NumPy arrays (iteration x scenario x
+component) and flushed to disk in chunks of complete iterations, so a long
+run can be resumed after a crash and the results can be read back without
+parsing CSV. `StatisticsAccumulator` builds the summary statistics tables
+from per-iteration totals, without keeping every sample. This module doesn't
+need brightway2, so it can be used from the statistics and figures notebooks.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_log = logging.getLogger(__name__)
+
+COLUMNS = ["scenario", "component", "method", "iteration", "score", "activity labels"]
+
+
+def _check_single_method(results):
+    """Raise a ValueError if `results` are tables for all methods."""
+    if any(isinstance(result, pd.DataFrame) for result in results):
+        raise ValueError(
+            "Results for all methods (all_methods=True) can't be stored here: "
+            "only {component: score} results for one method are supported"
+        )
+
+
+class ContributionSampleSink:
+    """Collect contribution scores into arrays, flushing chunks to `path`.
+
+    `path` is a directory. It holds `metadata.json`, describing the shape of
+    the results, and one `chunk-NNNNNN.npz` file for each complete chunk of
+    `chunk_size` iterations. If `path` already contains results with the same
+    metadata, the complete chunks are loaded, and `num_completed` says where
+    sampling should resume.
+
+    Example::
+
+        sink = ContributionSampleSink("results/gwp_samples", 1000, d_label, component_order)
+        samples = collect_contribution_samples(..., sink=sink)
+    """
+
+    def __init__(self, path, num_samples, scenarios, components, method_label="",
+                 chunk_size=50):
+        self.path = Path(path)
+        self.metadata = {
+            "num_samples": int(num_samples),
+            "scenarios": list(scenarios),
+            "components": list(components),
+            "method": method_label,
+            "chunk_size": int(chunk_size),
+        }
+        self.scenario_index = {s: i for i, s in enumerate(self.metadata["scenarios"])}
+        self.component_index = {c: i for i, c in enumerate(self.metadata["components"])}
+
+        self.scores = np.full((num_samples, len(scenarios), len(components)), np.nan)
+        self.activity_supply = np.full(num_samples, np.nan)
+        self.filled = np.zeros(num_samples, dtype=bool)
+        self.flushed_chunks = set()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        metadata_path = self.path / "metadata.json"
+        if metadata_path.exists():
+            existing = json.loads(metadata_path.read_text())
+            if existing != self.metadata:
+                raise ValueError(
+                    f"Existing results in {self.path} have different metadata: {existing}"
+                )
+            self._load_chunks()
+        else:
+            metadata_path.write_text(json.dumps(self.metadata, indent=2))
+
+    @property
+    def chunk_size(self):
+        return self.metadata["chunk_size"]
+
+    @property
+    def num_samples(self):
+        return self.metadata["num_samples"]
+
+    @property
+    def num_completed(self):
+        """Number of iterations at the start of the run which are complete."""
+        if self.filled.all():
+            return self.num_samples
+        return int(np.argmin(self.filled))
+
+    def _chunk_path(self, chunk):
+        return self.path / f"chunk-{chunk:06d}.npz"
+
+    def _chunk_slice(self, chunk):
+        start = chunk * self.chunk_size
+        return slice(start, min(start + self.chunk_size, self.num_samples))
+
+    def _load_chunks(self):
+        num_chunks = -(-self.num_samples // self.chunk_size)
+        for chunk in range(num_chunks):
+            chunk_path = self._chunk_path(chunk)
+            if not chunk_path.exists():
+                continue
+            with np.load(chunk_path) as data:
+                rows = self._chunk_slice(chunk)
+                self.scores[rows] = data["scores"]
+                self.activity_supply[rows] = data["activity_supply"]
+                self.filled[rows] = True
+            self.flushed_chunks.add(chunk)
+        _log.info("Loaded %d complete chunks from %s", len(self.flushed_chunks), self.path)
+
+    def add(self, iteration, results, activity_supply=None):
+        """Store the results of one iteration.
+
+        `results` is a list with one {component: score} dictionary per
+        scenario, in the same order as the sink's scenarios. Components which
+        are not included in a result are stored as zero. Results for all
+        methods (from `all_methods=True`) raise a ValueError.
+        """
+        _check_single_method(results)
+        if len(results) != len(self.scenario_index):
+            raise ValueError(f"Expected {len(self.scenario_index)} results, got {len(results)}")
+        values = np.zeros(self.scores.shape[1:])
+        for i, result in enumerate(results):
+            for component, score in result.items():
+                if component not in self.component_index:
+                    raise KeyError(f"Unknown component {component!r}")
+                values[i, self.component_index[component]] = score
+        self.scores[iteration] = values
+        if activity_supply is not None:
+            self.activity_supply[iteration] = activity_supply
+        self.filled[iteration] = True
+
+        chunk = iteration // self.chunk_size
+        if chunk not in self.flushed_chunks and self.filled[self._chunk_slice(chunk)].all():
+            self.flush_chunk(chunk)
+
+    def flush_chunk(self, chunk):
+        """Write one complete chunk to disk."""
+        rows = self._chunk_slice(chunk)
+        chunk_path = self._chunk_path(chunk)
+        # Write to a temporary file first so a crash never leaves a partial chunk
+        tmp_path = chunk_path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            scores=self.scores[rows],
+            activity_supply=self.activity_supply[rows],
+        )
+        os.replace(tmp_path, chunk_path)
+        self.flushed_chunks.add(chunk)
+        _log.debug("Flushed chunk %d to %s", chunk, chunk_path)
+
+    def to_dataframe(self, energy_scenario=None):
+        """Return the completed iterations in the long DataFrame format."""
+        return _to_dataframe(
+            self.scores[:self.num_completed],
+            self.activity_supply[:self.num_completed],
+            self.metadata,
+            energy_scenario,
+        )
+
+
+def _to_dataframe(scores, activity_supply, metadata, energy_scenario=None):
+    num_iterations, num_scenarios, num_components = scores.shape
+    scenarios = np.asarray(metadata["scenarios"], dtype=object)
+    components = np.asarray(metadata["components"], dtype=object)
+    df = pd.DataFrame({
+        "scenario": np.tile(np.repeat(scenarios, num_components), num_iterations),
+        "component": np.tile(components, num_iterations * num_scenarios),
+        "method": metadata["method"],
+        "iteration": np.repeat(np.arange(num_iterations), num_scenarios * num_components),
+        "score": scores.ravel(),
+        "activity labels": np.repeat(activity_supply, num_scenarios * num_components),
+    }, columns=COLUMNS)
+    if energy_scenario is not None:
+        df["energy_scenario"] = energy_scenario
+    return df
+
+
+def load_contribution_samples(path, energy_scenario=None):
+    """Load samples written by `ContributionSampleSink` as a DataFrame.
+
+    `path` can be a single results directory, or a dictionary
+    {energy_scenario: path} in which case the results are concatenated with
+    an "energy_scenario" column, like `samples_comparative_gwp_contributions.csv`.
+    Only complete chunks at the start of the run are included.
+    """
+    if isinstance(path, dict):
+        return pd.concat(
+            [load_contribution_samples(p, energy_scenario=label) for label, p in path.items()],
+            ignore_index=True,
+        )
+    scores, activity_supply, metadata = load_contribution_arrays(path)
+    return _to_dataframe(scores, activity_supply, metadata, energy_scenario)
+
+
+def load_contribution_arrays(path):
+    """Load samples written by `ContributionSampleSink` as arrays.
+
+    Returns (scores, activity_supply, metadata), where `scores` has shape
+    (iteration, scenario, component) as listed in `metadata`.
+    """
+    path = Path(path)
+    metadata = json.loads((path / "metadata.json").read_text())
+    chunk_size = metadata["chunk_size"]
+    scores = []
+    activity_supply = []
+    for chunk in range(-(-metadata["num_samples"] // chunk_size)):
+        chunk_path = path / f"chunk-{chunk:06d}.npz"
+        if not chunk_path.exists():
+            break
+        with np.load(chunk_path) as data:
+            scores.append(data["scores"])
+            activity_supply.append(data["activity_supply"])
+    num_scenarios = len(metadata["scenarios"])
+    num_components = len(metadata["components"])
+    if scores:
+        scores = np.concatenate(scores)
+        activity_supply = np.concatenate(activity_supply)
+    else:
+        scores = np.zeros((0, num_scenarios, num_components))
+        activity_supply = np.zeros(0)
+    return scores, activity_supply, metadata
+
+
+def _label(label):
+    # JSON turns (scenario, energy_scenario) tuples into lists
+    return tuple(label) if isinstance(label, list) else label
+
+
+class InventoryStore:
+    """Per-activity results for each sample and demand, to regroup later.
+
+    For a chosen set of `activities` (those which might be named in a
+    contribution mapping, such as all the foreground activities), the store
+    holds, for each sample and demand, each activity's supply and its
+    contribution: the score of everything the activity's supply drives,
+    which is the score `ScoreGrouper` gives a group of just that activity.
+    A group's score is the sum of its activities' contributions, so any
+    mapping of these activities can be scored afterwards (see
+    `regroup_contributions`) without solving anything again.
+
+    `path` is a directory holding `metadata.json`, float32 memory maps
+    `supply.f32` and `contribution.f32` (sample x demand x activity),
+    `total.f64` with the total score (sample x demand), and `recorded.u1`
+    marking the samples which have been written. Open an existing store with
+    just `path`; to create one, also give `num_samples`, `demand_labels` and
+    `activities` (a list of (database, code) keys). Pass it as
+    `inventory=` to `collect_contribution_samples`. The store is pickled by
+    path, so worker processes write to the same files.
+    """
+
+    def __init__(self, path, num_samples=None, demand_labels=None, activities=None):
+        self.path = Path(path)
+        metadata_path = self.path / "metadata.json"
+        if activities is not None:
+            metadata = {
+                "num_samples": int(num_samples),
+                "demands": list(demand_labels),
+                "activities": [list(getattr(a, "key", a)) for a in activities],
+            }
+            if not metadata_path.exists():
+                self._create(metadata)
+        self.metadata = json.loads(metadata_path.read_text())
+        if activities is not None and self.metadata != json.loads(json.dumps(metadata)):
+            raise ValueError(f"Existing inventories in {self.path} have different metadata")
+        self._open()
+
+    def _create(self, metadata):
+        self.path.mkdir(parents=True, exist_ok=True)
+        shape = (metadata["num_samples"], len(metadata["demands"]), len(metadata["activities"]))
+        for name, dtype, array_shape in self._arrays(shape):
+            np.memmap(self.path / name, dtype=dtype, mode="w+", shape=array_shape).flush()
+        (self.path / "metadata.json").write_text(json.dumps(metadata, indent=2))
+        _log.info("Created inventory store %s", self.path)
+
+    @staticmethod
+    def _arrays(shape):
+        return [
+            ("supply.f32", np.float32, shape),
+            ("contribution.f32", np.float32, shape),
+            ("total.f64", np.float64, shape[:2]),
+            ("recorded.u1", np.uint8, shape[:1]),
+        ]
+
+    def _open(self):
+        shape = (self.num_samples, len(self.demand_labels), len(self.activities))
+        self.supply, self.contribution, self.total, self.recorded = [
+            np.memmap(self.path / name, dtype=dtype, mode="r+", shape=array_shape)
+            for name, dtype, array_shape in self._arrays(shape)
+        ]
+        self._indices = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.metadata = json.loads((self.path / "metadata.json").read_text())
+        self._open()
+
+    @property
+    def num_samples(self):
+        return self.metadata["num_samples"]
+
+    @property
+    def demand_labels(self):
+        return [_label(label) for label in self.metadata["demands"]]
+
+    @property
+    def activities(self):
+        return [tuple(key) for key in self.metadata["activities"]]
+
+    def indices(self, activity_dict):
+        """Matrix indices of the store's activities in `activity_dict`."""
+        if self._indices is None or self._indices[0] is not activity_dict:
+            self._indices = (
+                activity_dict,
+                np.array([activity_dict[key] for key in self.activities], dtype=int),
+            )
+        return self._indices[1]
+
+    def write(self, iteration, supply, contribution, total):
+        """Store one sample: (demand x activity) arrays and the demand totals."""
+        self.supply[iteration] = supply
+        self.contribution[iteration] = contribution
+        self.total[iteration] = total
+        self.recorded[iteration] = 1
+
+    def flush(self):
+        for array in (self.supply, self.contribution, self.total, self.recorded):
+            array.flush()
+
+    @property
+    def num_completed(self):
+        """Number of samples at the start of the store which are complete."""
+        recorded = np.asarray(self.recorded, dtype=bool)
+        return len(recorded) if recorded.all() else int(np.argmin(recorded))
+
+
+def regroup_contributions(store, final_activities, component_order=(), method_label="",
+                          activity_labels=None, residual_label=None, strict=False):
+    """Contribution samples for a new mapping, from an `InventoryStore`.
+
+    `final_activities` is an {activity: label} mapping of activities in the
+    store. Returns the same DataFrame as `collect_contribution_samples`
+    would, for the complete samples at the start of the store: components
+    in `component_order` first (zero if absent from the mapping), then any
+    other labels. If `activity_labels` is given, the "activity labels"
+    column is the supply of those activities for the last demand, as
+    `collect_contribution_samples` reports it. If `residual_label` is given,
+    the part of each total not in any group is added under that label.
+
+    As for `bw_helpers.ScoreGrouper`, activities which are not in the store
+    are logged and left out (so their groups may be zero), or with
+    `strict=True` raise a KeyError.
+    """
+    position = {key: i for i, key in enumerate(store.activities)}
+
+    def indicator(mapping):
+        labels = list(dict.fromkeys(mapping.values()))
+        matrix = np.zeros((len(store.activities), len(labels)), dtype=np.float32)
+        missing = []
+        for key, label in mapping.items():
+            key = getattr(key, "key", key)
+            if key in position:
+                matrix[position[key], labels.index(label)] = 1
+            else:
+                missing.append((key, label))
+        if missing:
+            if strict:
+                raise KeyError(f"Activities not in the inventory store: {missing}")
+            _log.warning("%d mapped activities are not in the inventory store: %s",
+                         len(missing), missing)
+        return labels, matrix
+
+    labels, groups = indicator(final_activities)
+    components = list(component_order) + [label for label in labels if label not in component_order]
+    n = store.num_completed
+    grouped = np.asarray(store.contribution[:n]) @ groups
+    scores = np.zeros(grouped.shape[:2] + (len(components),))
+    for j, label in enumerate(labels):
+        scores[:, :, components.index(label)] = grouped[:, :, j]
+    if residual_label is not None:
+        components.append(residual_label)
+        residual = store.total[:n] - grouped.sum(axis=2)
+        scores = np.concatenate([scores, residual[:, :, None]], axis=2)
+
+    if activity_labels:
+        _, selected = indicator(activity_labels)
+        supply = np.asarray(store.supply[:n, -1]) @ selected.sum(axis=1)
+    else:
+        supply = np.full(n, None, dtype=object)
+
+    df = _to_dataframe(scores, supply, {
+        "scenarios": list(range(len(store.demand_labels))),
+        "components": components,
+        "method": method_label,
+    })
+    return _label_scenarios(df, store.demand_labels)
+
+
+def _label_scenarios(df, demand_labels):
+    """Replace demand numbers in the "scenario" column by `demand_labels`.
+
+    (scenario, energy_scenario) labels are split into two columns.
+    """
+    scenario_labels = [demand_labels[i] for i in df["scenario"]]
+    if any(isinstance(label, tuple) for label in demand_labels):
+        df["energy_scenario"] = [label[1] for label in scenario_labels]
+        scenario_labels = [label[0] for label in scenario_labels]
+    df["scenario"] = scenario_labels
+    return df
+
+
+# Components left out of the "instruments and implant (mat and mnf)" group
+NON_MATERIAL_COMPONENTS = ["Anesthesia", "Packaging", "Transport", "Sterilisation", "Argon"]
+
+STATS_COLUMNS = ["mean", "median", "minimum", "maximum", "25th Percentile", "75th Percentile", "IQR"]
+
+
+class _Series:
+    """Values indexed by iteration, in a growing array (NaN where missing)."""
+
+    def __init__(self, capacity=1024):
+        self.values = np.full(capacity, np.nan)
+
+    def _grow(self, iteration):
+        if iteration >= len(self.values):
+            grown = np.full(max(2 * len(self.values), iteration + 1), np.nan)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+
+    def set(self, iteration, value):
+        """Set the value of `iteration`, replacing any value it had."""
+        self._grow(iteration)
+        self.values[iteration] = value
+
+    def add_part(self, iteration, value):
+        """Add part of the value of `iteration` to what it has so far."""
+        self._grow(iteration)
+        if np.isnan(self.values[iteration]):
+            self.values[iteration] = value
+        else:
+            self.values[iteration] += value
+
+
+def hdi(values, prob=0.9):
+    """Narrowest interval containing `prob` of `values`, as `arviz.hdi` does."""
+    values = np.sort(values)
+    n = len(values)
+    interval_idx_inc = int(np.floor(prob * n))
+    n_intervals = n - interval_idx_inc
+    interval_width = values[interval_idx_inc:] - values[:n_intervals]
+    if len(interval_width) == 0:
+        raise ValueError("Too few elements for interval calculation")
+    min_idx = np.argmin(interval_width)
+    return values[min_idx], values[min_idx + interval_idx_inc]
+
+
+def describe(values, include_hdi=False):
+    """Summary statistics as in the "Statistical description" notebooks."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    q25, median, q75 = np.quantile(values, [0.25, 0.5, 0.75])
+    stats = {
+        "mean": values.mean(),
+        "median": median,
+        "minimum": values.min(),
+        "maximum": values.max(),
+        "25th Percentile": q25,
+        "75th Percentile": q75,
+        "IQR": q75 - q25,
+    }
+    if include_hdi:
+        stats["hdi_90_lower"], stats["hdi_90_upper"] = hdi(values, 0.9)
+    return stats
+
+
+class StatisticsAccumulator:
+    """Accumulate per-iteration totals, and report the statistics tables.
+
+    Instead of keeping every (iteration, scenario, component) row, only the
+    per-iteration sums needed for the tables are kept: the total excluding
+    the "Total" component, and the material and manufacture total (also
+    excluding `NON_MATERIAL_COMPONENTS`), for each (scenario,
+    energy_scenario). The statistics are exact.
+
+    Results can be added as each iteration is sampled (`add`, or pass
+    `accumulator=` to `collect_contribution_samples`) or in chunks of the long
+    DataFrame format (`add_frame`). `write` saves `stats_totals.csv`,
+    `stats_material_manufacture.csv` and `stats_totals_ratios.csv`.
+    """
+
+    def __init__(self, reference=("CM HTO", "Current"),
+                 exclude_from_ratios=(("UKR", "Greener"), ("CM HTO", "Greener")),
+                 non_material_components=NON_MATERIAL_COMPONENTS):
+        self.reference = tuple(reference)
+        self.exclude_from_ratios = {tuple(key) for key in exclude_from_ratios}
+        self.non_material_components = set(non_material_components)
+        self.totals = {}
+        self.material_manufacture = {}
+
+    def _add_value(self, store, key, iteration, value, part=False):
+        if key not in store:
+            store[key] = _Series()
+        if part:
+            store[key].add_part(iteration, value)
+        else:
+            store[key].set(iteration, value)
+
+    def add(self, iteration, demand_labels, results, energy_scenario="Current"):
+        """Add the results of one iteration.
+
+        `results` is the list of {component: score} from
+        `sample_comparative_contribution`, labelled by `demand_labels`. A
+        label can also be a (scenario, energy_scenario) tuple. Adding an
+        iteration again replaces its earlier results. Results for all
+        methods (from `all_methods=True`) raise a ValueError.
+        """
+        _check_single_method(results)
+        for label, result in zip(demand_labels, results):
+            key = tuple(label) if isinstance(label, tuple) else (label, energy_scenario)
+            total = sum(v for k, v in result.items() if k != "Total")
+            material = sum(
+                v for k, v in result.items()
+                if k != "Total" and k not in self.non_material_components
+            )
+            self._add_value(self.totals, key, iteration, total)
+            self._add_value(self.material_manufacture, key, iteration, material)
+
+    def add_frame(self, df):
+        """Add a chunk of samples in the long DataFrame format.
+
+        The rows of one iteration can be split between chunks, so the sums
+        from each chunk are added together: add each row only once.
+        """
+        df = df[df["component"] != "Total"]
+        material = df[~df["component"].isin(self.non_material_components)]
+        for store, frame in [(self.totals, df), (self.material_manufacture, material)]:
+            sums = frame.groupby(["scenario", "energy_scenario", "iteration"])["score"].sum()
+            for (scenario, energy_scenario, iteration), value in sums.items():
+                self._add_value(store, (scenario, energy_scenario), int(iteration), value,
+                                part=True)
+
+    def _table(self, store, include_hdi=False):
+        rows = [
+            {"scenario": scenario, "energy_scenario": energy_scenario,
+             **describe(series.values, include_hdi)}
+            for (scenario, energy_scenario), series in sorted(store.items())
+        ]
+        return pd.DataFrame(rows)
+
+    def stats_totals(self):
+        return self._table(self.totals)
+
+    def stats_material_manufacture(self):
+        df = self._table(self.material_manufacture)
+        df["component"] = "instruments and implant (mat and mnf)"
+        return df
+
+    def ratio_samples(self):
+        """Per-iteration totals relative to the reference scenario.
+
+        The totals leave out the "Total" component, as Figures.ipynb does
+        before writing `relative_gwp_contributions.csv`, from which the
+        ratios notebook makes `stats_totals_ratios.csv`.
+        """
+        reference = self.totals[self.reference].values
+        ratios = {}
+        for key, series in self.totals.items():
+            if key in self.exclude_from_ratios:
+                continue
+            n = min(len(series.values), len(reference))
+            ratios[key] = series.values[:n] / reference[:n]
+        return ratios
+
+    def stats_totals_ratios(self):
+        rows = [
+            {"scenario": scenario, "energy_scenario": energy_scenario,
+             **describe(values, include_hdi=True)}
+            for (scenario, energy_scenario), values in sorted(self.ratio_samples().items())
+        ]
+        return pd.DataFrame(rows)
+
+    def write(self, directory="results"):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.stats_totals().to_csv(directory / "stats_totals.csv", index=False)
+        self.stats_material_manufacture().to_csv(
+            directory / "stats_material_manufacture.csv", index=False
+        )
+        self.stats_totals_ratios().to_csv(directory / "stats_totals_ratios.csv", index=False)
+
+
+QUANTILES = {"25th Percentile": 0.25, "median": 0.5, "75th Percentile": 0.75}
+
+
+class ConvergenceMonitor:
+    """Decide when Monte Carlo statistics are precise enough to stop sampling.
+
+    `targets` is a dictionary {statistic: tolerance}, where statistic is one
+    of "median", "25th Percentile" or "75th Percentile". For each series of
+    samples, the uncertainty in each statistic is estimated by bootstrap
+    resampling, as the width of its `confidence` interval. If `relative` is
+    True (the default), the width is divided by the estimate before
+    comparing with the tolerance.
+
+    Example::
+
+        monitor = ConvergenceMonitor({"median": 0.005, "25th Percentile": 0.01, "75th Percentile": 0.01})
+        precision = monitor.check(accumulator_series(accumulator))
+        if monitor.converged(precision): ...
+    """
+
+    def __init__(self, targets, relative=True, confidence=0.95, n_bootstrap=200, seed=0):
+        unknown = set(targets) - set(QUANTILES)
+        if unknown:
+            raise ValueError(f"Unknown statistics: {unknown}")
+        self.targets = dict(targets)
+        self.relative = relative
+        self.confidence = confidence
+        self.n_bootstrap = n_bootstrap
+        self.rng = np.random.default_rng(seed)
+
+    def _widths(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        qs = [QUANTILES[statistic] for statistic in self.targets]
+        estimates = np.quantile(values, qs)
+        resampled = values[self.rng.integers(len(values), size=(self.n_bootstrap, len(values)))]
+        boot = np.quantile(resampled, qs, axis=1)
+        alpha = (1 - self.confidence) / 2
+        lower, upper = np.quantile(boot, [alpha, 1 - alpha], axis=1)
+        return estimates, upper - lower, len(values)
+
+    def check(self, series):
+        """Return a DataFrame of the achieved precision for each series.
+
+        `series` is a dictionary {name: sample values}; names can be tuples.
+        """
+        rows = []
+        for name, values in series.items():
+            estimates, widths, n = self._widths(values)
+            for statistic, estimate, width in zip(self.targets, estimates, widths):
+                precision = abs(width / estimate) if self.relative else width
+                rows.append({
+                    "series": name,
+                    "statistic": statistic,
+                    "num_samples": n,
+                    "estimate": estimate,
+                    "interval_width": width,
+                    "precision": precision,
+                    "target": self.targets[statistic],
+                    "converged": precision <= self.targets[statistic],
+                })
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def converged(precision):
+        return bool(len(precision)) and bool(precision["converged"].all())
+
+
+def accumulator_series(accumulator, ratios=True):
+    """Series to monitor from a `StatisticsAccumulator`: totals and ratios."""
+    series = {("total",) + key: s.values for key, s in accumulator.totals.items()}
+    if ratios and accumulator.reference in accumulator.totals:
+        series.update({
+            ("ratio",) + key: values
+            for key, values in accumulator.ratio_samples().items()
+            if key != accumulator.reference
+        })
+    return series
@@ -0,0 +1,545 @@
+"""Run the LCA calculations, statistics and figures from the command line.
+
+This does what the notebooks do, in order: the Monte Carlo comparative LCA
+(`Comparative LCA.ipynb`), the static contribution analysis for all impact
+categories (`Contribution analysis.ipynb`), the metal impacts
+(`Metal_impacts.ipynb`), the two statistical descriptions, and the figures
+(by executing `Figures.ipynb`). Each stage is only run if its inputs have
+changed since it last ran: the configuration it uses, the source files it
+depends on, the outputs of the stages before it, and -- for stages using
+Brightway -- the databases and methods in the project. Stages which don't
+depend on each other run at the same time, in separate processes.
+
+The record of what ran with which inputs is kept in `.pipeline/`. Run with::
+
+    python pipeline.py                  # everything that is out of date
+    python pipeline.py stats --jobs 2   # the statistics, and what they need
+    python pipeline.py --dry-run        # list what would run
+    python pipeline.py --force comparative --set num_samples=2000
+
+Brightway and the other heavy modules are only imported by the stages that
+need them, so checking what is up to date is quick.
+"""
+
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+_log = logging.getLogger(__name__)
+
+ROOT = Path(__file__).parent
+STATE_DIR = ".pipeline"
+
+# The calculations in the notebooks
+DEFAULT_CONFIG = {
+    "project": "default",
+    "method": ["ReCiPe 2016 v1.03, midpoint (H)", "climate change",
+               "global warming potential (GWP1000)"],
+    "devices": {
+        "UKR": ["UKR", "663ac4ef3d314e739f29ec63ea2ca399"],
+        "CM HTO": ["CM HTO", "2f3acaae6c4e4035b2d24c71725b17d8"],
+        "AM HTO": ["AM HTO", "1a637b9baee74199b8027ffeb333279c"],
+        "AM HTO (steel jig)": ["AM HTO- jig steel", "1a637b9baee74199b8027ffeb333279c"],
+    },
+    # Devices in the Monte Carlo comparison, for the current electricity
+    # supply and with low-carbon electricity for additive manufacture
+    "comparative_devices": ["UKR", "CM HTO", "AM HTO", "AM HTO (steel jig)"],
+    "greener_devices": ["AM HTO", "AM HTO (steel jig)"],
+    # Low-carbon electricity: `new` replaces `old` as the input to `outputs`
+    "electricity_swaps": [
+        {
+            "old": ["Electricity", "826d168b2214847a40d2707229194e67_copy1"],
+            "new": ["Electricity", "f115d3e7dd5f261c41b6f41a7b5df4ff_copy1"],
+            "outputs": [
+                ["AM HTO", "fa8649e486f344bdaf9e06ce1df2699a_copy5"],
+                ["AM HTO", "8fc93e48b98c4f7487ff73fef8362399_copy1"],
+                ["AM HTO", "fa8649e486f344bdaf9e06ce1df2699a_copy7"],
+            ],
+        },
+        {
+            "old": ["Electricity", "826d168b2214847a40d2707229194e67_copy2"],
+            "new": ["Electricity", "f115d3e7dd5f261c41b6f41a7b5df4ff_copy2"],
+            "outputs": [
+                ["AM HTO", "fa8649e486f344bdaf9e06ce1df2699a"],
+                ["AM HTO", "8fc93e48b98c4f7487ff73fef8362399_copy2"],
+                ["AM HTO- jig steel", "fa8649e486f344bdaf9e06ce1df2699a"],
+                ["AM HTO", "fa8649e486f344bdaf9e06ce1df2699a_copy8"],
+            ],
+        },
+    ],
+    "contribution_devices": ["CM HTO", "AM HTO", "UKR"],
+    "methods": [
+        ["ReCiPe 2016 v1.03, midpoint (H)", category, indicator]
+        for category, indicator in [
+            ("acidification: terrestrial", "terrestrial acidification potential (TAP)"),
+            ("climate change", "global warming potential (GWP1000)"),
+            ("ecotoxicity: freshwater", "freshwater ecotoxicity potential (FETP)"),
+            ("ecotoxicity: marine", "marine ecotoxicity potential (METP)"),
+            ("ecotoxicity: terrestrial", "terrestrial ecotoxicity potential (TETP)"),
+            ("energy resources: non-renewable, fossil", "fossil fuel potential (FFP)"),
+            ("eutrophication: freshwater", "freshwater eutrophication potential (FEP)"),
+            ("eutrophication: marine", "marine eutrophication potential (MEP)"),
+            ("human toxicity: carcinogenic", "human toxicity potential (HTPc)"),
+            ("human toxicity: non-carcinogenic", "human toxicity potential (HTPnc)"),
+            ("ionising radiation", "ionising radiation potential (IRP)"),
+            ("land use", "agricultural land occupation (LOP)"),
+            ("material resources: metals/minerals", "surplus ore potential (SOP)"),
+            ("ozone depletion", "ozone depletion potential (ODPinfinite)"),
+            ("particulate matter formation", "particulate matter formation potential (PMFP)"),
+            ("photochemical oxidant formation: human health",
+             "photochemical oxidant formation potential: humans (HOFP)"),
+            ("photochemical oxidant formation: terrestrial ecosystems",
+             "photochemical oxidant formation potential: ecosystems (EOFP)"),
+            ("water use", "water consumption potential (WCP)"),
+        ]
+    ],
+    "metals": {
+        "CoCr": ["Raw materials", "08914bd137d643eb86c15648a647e32e_copy1"],
+        "Ti6Al4V_workpiece": ["Raw materials", "ca1c1d7535114301918a4870a775bc76"],
+        "Ti6Al4V_powder": ["Raw materials", "9f5be7543bec47cab0eefbe8257b9291_copy1"],
+        "stainless_steel": ["Raw materials", "809c09c13b0e7129a79aabed4e9e2c08_copy1"],
+    },
+    "num_samples": 1000,
+    "seed": 42,
+    # Worker processes for each Monte Carlo run (see `collect_contribution_samples`)
+    "processes": None,
+}
+
+
+class Stage:
+    """One step of the pipeline.
+
+    `func(config, root)` writes the files in `outputs` (relative to `root`).
+    The stage's key, which decides whether it needs to run again, is built
+    from the `config` entries it uses, the contents of `sources` (with the
+    modules in `root` which they import) and of the module defining `func`, the outputs of the stages in `deps`, and, if
+    `databases` is True, the Brightway project's database and method
+    metadata.
+    """
+
+    def __init__(self, name, func, deps=(), outputs=(), config=(), sources=(),
+                 databases=False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.outputs = list(outputs)
+        self.config = list(config)
+        self.sources = list(sources)
+        self.databases = databases
+
+
+STAGES = {}
+
+
+def stage(name, **kwargs):
+    """Register the decorated function as a pipeline stage (see `Stage`)."""
+    def decorator(func):
+        STAGES[name] = Stage(name, func, **kwargs)
+        return func
+    return decorator
+
+
+def _set_project(config):
+    import brightway2 as bw
+
+    bw.projects.set_current(config["project"])
+    return bw
+
+
+def _keys(keys):
+    return [tuple(key) for key in keys]
+
+
+@stage(
+    "comparative",
+    outputs=["results/samples_comparative_gwp_contributions.csv"],
+    config=["project", "method", "devices", "comparative_devices", "greener_devices",
+            "electricity_swaps", "num_samples", "seed", "processes"],
+    sources=["bw_helpers.py", "final_activities.py"],
+    databases=True,
+)
+def comparative(config, root):
+    _set_project(config)
+    import pandas as pd
+
+    from bw_helpers import MyMonteCarloLCA, build_swap_presamples, collect_contribution_samples
+    from final_activities import component_order, final_activities
+
+    method = tuple(config["method"])
+    devices = {label: tuple(key) for label, key in config["devices"].items()}
+    _, presamples_path = build_swap_presamples(
+        [(tuple(swap["old"]), tuple(swap["new"]), _keys(swap["outputs"]))
+         for swap in config["electricity_swaps"]],
+        config["num_samples"], seed=config["seed"], directory=root / STATE_DIR / "presamples",
+    )
+
+    def run(labels, presamples=None):
+        demands = [{devices[label]: 1} for label in labels]
+        lca = MyMonteCarloLCA({devices[label]: 1 for label in labels}, method=method,
+                              presamples=presamples)
+        next(lca)
+        return collect_contribution_samples(
+            lca, demands, final_activities, num_samples=config["num_samples"],
+            method_label=method[1], demand_labels=labels, component_order=component_order,
+            seed=config["seed"], processes=config["processes"],
+        )
+
+    samples = run(config["comparative_devices"])
+    samples["energy_scenario"] = "Current"
+    samples_lce = run(config["greener_devices"], presamples=[presamples_path])
+    samples_lce["energy_scenario"] = "Greener"
+    pd.concat([samples, samples_lce]).to_csv(
+        root / "results/samples_comparative_gwp_contributions.csv", index=False
+    )
+
+
+@stage(
+    "contribution",
+    outputs=["results/all_impact_category_contributions.csv"],
+    config=["project", "devices", "contribution_devices", "methods"],
+    sources=["bw_helpers.py", "final_activities.py"],
+    databases=True,
+)
+def contribution(config, root):
+    _set_project(config)
+    import pandas as pd
+
+    from bw_helpers import contributions_all_methods
+    from final_activities import component_order, final_activities
+
+    methods = [tuple(method) for method in config["methods"]]
+    frames = []
+    for label in config["contribution_devices"]:
+        demand = {tuple(config["devices"][label]): 1}
+        table = contributions_all_methods(demand, methods, final_activities)
+        df = (
+            table.reindex(columns=component_order)
+                .reset_index(names="method")
+                .melt(id_vars=["method"], var_name="component", value_name="score")
+        )
+        df["device"] = label
+        frames.append(df.fillna(0))
+    contribs = pd.concat(frames, ignore_index=True)
+
+    # Normalise by the CM HTO total for each method
+    method_ref_scores = contribs.query("device == 'CM HTO'").groupby("method")["score"].sum()
+    contribs["normalised_score"] = contribs["score"] / contribs["method"].map(method_ref_scores)
+    contribs.to_csv(root / "results/all_impact_category_contributions.csv", index=False)
+
+
+@stage(
+    "metals",
+    outputs=["results/metal_gwp.csv"],
+    config=["project", "method", "metals", "num_samples", "seed"],
+    sources=["bw_helpers.py"],
+    databases=True,
+)
+def metals(config, root):
+    _set_project(config)
+    from bw_helpers import MyMonteCarloLCA, reference_flow_samples
+
+    flows = {label: tuple(key) for label, key in config["metals"].items()}
+    lca = MyMonteCarloLCA({key: 1 for key in flows.values()}, method=tuple(config["method"]))
+    lca.reseed(config["seed"])
+    df, _ = reference_flow_samples(lca, flows, config["num_samples"])
+    df.to_csv(root / "results/metal_gwp.csv", index=False)
+
+
+def _accumulate_samples(root):
+    import pandas as pd
+
+    from mc_results import StatisticsAccumulator
+
+    accumulator = StatisticsAccumulator()
+    for chunk in pd.read_csv(root / "results/samples_comparative_gwp_contributions.csv",
+                             chunksize=500_000):
+        accumulator.add_frame(chunk)
+    return accumulator
+
+
+@stage(
+    "stats",
+    deps=["comparative", "metals"],
+    outputs=["results/stats_totals.csv", "results/stats_material_manufacture.csv",
+             "results/stats_metals.csv"],
+    sources=["mc_results.py"],
+)
+def stats(config, root):
+    import pandas as pd
+
+    from mc_results import describe
+
+    accumulator = _accumulate_samples(root)
+    accumulator.stats_totals().to_csv(root / "results/stats_totals.csv", index=False)
+    accumulator.stats_material_manufacture().to_csv(
+        root / "results/stats_material_manufacture.csv", index=False
+    )
+
+    metal_impacts = pd.read_csv(root / "results/metal_gwp.csv")
+    columns = ["mean", "median", "25th Percentile", "75th Percentile", "IQR"]
+    rows = []
+    for material, group in metal_impacts.groupby("material"):
+        material_stats = describe(group["score"])
+        rows.append({"material": material, **{k: material_stats[k] for k in columns}})
+    pd.DataFrame(rows).to_csv(root / "results/stats_metals.csv", index=False)
+
+
+@stage(
+    "ratios",
+    deps=["comparative"],
+    outputs=["results/stats_totals_ratios.csv"],
+    sources=["mc_results.py"],
+)
+def ratios(config, root):
+    accumulator = _accumulate_samples(root)
+    accumulator.stats_totals_ratios().to_csv(root / "results/stats_totals_ratios.csv", index=False)
+
+
+@stage(
+    "figures",
+    deps=["comparative", "contribution"],
+    outputs=["figures/overall_gwp_comparison.pdf",
+             "figures/overall_gwp_comparison_contributions.pdf",
+             "figures/all_impact_contributions.pdf",
+             "results/relative_gwp_contributions.csv"],
+    sources=["Figures.ipynb"],
+)
+def figures(config, root):
+    import nbformat
+    from nbconvert.preprocessors import ExecutePreprocessor
+
+    notebook = nbformat.read(root / "Figures.ipynb", as_version=4)
+    ExecutePreprocessor(timeout=None).preprocess(notebook, {"metadata": {"path": str(root)}})
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents, or of the files in a directory."""
+    path = Path(path)
+    digest = hashlib.sha256()
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for file in files:
+        digest.update(str(file.relative_to(path.parent)).encode())
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def local_imports(path, root=ROOT):
+    """Modules in `root` imported by the Python file `path`, and by those, and so on.
+
+    Returns the paths relative to `root`, including `path` itself.
+    """
+    found = []
+    pending = [Path(path)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.append(path)
+        if path.suffix != ".py":
+            continue
+        for node in ast.walk(ast.parse((root / path).read_text())):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = Path(name.split(".")[0] + ".py")
+                if (root / module).exists():
+                    pending.append(module)
+    return found
+
+
+def project_fingerprint(config, methods=()):
+    """Metadata of the databases in the project and of `methods`.
+
+    Brightway updates the "modified" time of a database whenever it is
+    written, so this changes when any inventory data changes.
+    """
+    import bw2data as bd
+
+    bd.projects.set_current(config["project"])
+    return {
+        "databases": {name: bd.databases[name] for name in sorted(bd.databases)},
+        "methods": [bd.methods.get(tuple(method)) for method in methods],
+    }
+
+
+def stage_key(stage, config, manifest, root=ROOT):
+    """Hash of everything the outputs of `stage` depend on."""
+    inputs = {
+        "stage": stage.name,
+        "config": {name: config[name] for name in stage.config},
+        "sources": {
+            str(path): file_hash(root / path)
+            for source in stage.sources for path in local_imports(source, root)
+        },
+        "code": file_hash(inspect.getsourcefile(stage.func)),
+        "deps": {dep: manifest.entries[dep]["outputs"] for dep in stage.deps},
+    }
+    if stage.databases:
+        methods = [config["method"]] if "method" in stage.config else []
+        methods += config["methods"] if "methods" in stage.config else []
+        inputs["project"] = project_fingerprint(config, methods)
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class Manifest:
+    """The key and output hashes of each stage when it last ran."""
+
+    def __init__(self, root=ROOT):
+        self.root = Path(root)
+        self.path = self.root / STATE_DIR / "manifest.json"
+        self.entries = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def up_to_date(self, stage, key):
+        """True if `stage` last ran with `key`, and its outputs are unchanged."""
+        entry = self.entries.get(stage.name)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(
+            (self.root / output).exists() and file_hash(self.root / output) == digest
+            for output, digest in entry["outputs"].items()
+        )
+
+    def record(self, stage, key, seconds):
+        self.entries[stage.name] = {
+            "key": key,
+            "outputs": {output: file_hash(self.root / output) for output in stage.outputs},
+            "seconds": round(seconds, 1),
+            "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a partial manifest
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2))
+        os.replace(tmp_path, self.path)
+
+
+def with_dependencies(targets):
+    """`targets` and all the stages they depend on, in dependency order."""
+    order = []
+
+    def visit(name):
+        if name not in STAGES:
+            raise KeyError(f"Unknown stage {name!r}; stages are {list(STAGES)}")
+        if name in order:
+            return
+        for dep in STAGES[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for name in targets:
+        visit(name)
+    return order
+
+
+def _run_stage(name, config, root):
+    start = time.perf_counter()
+    STAGES[name].func(config, Path(root))
+    return time.perf_counter() - start
+
+
+def run(targets=None, config=None, jobs=None, force=(), dry_run=False, root=ROOT):
+    """Run the stages in `targets` (default all) which are out of date.
+
+    Stages in `force` run whatever their key. Returns {stage: status},
+    where status is "up to date", "ran", or with `dry_run`, "would run".
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    root = Path(root)
+    selected = with_dependencies(targets or list(STAGES))
+    manifest = Manifest(root)
+    status = {}
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while running or len(status) < len(selected):
+            for name in selected:
+                stage = STAGES[name]
+                if name in status or any(status.get(dep) not in ("up to date", "ran")
+                                         for dep in stage.deps):
+                    continue
+                key = stage_key(stage, config, manifest, root)
+                if name not in force and manifest.up_to_date(stage, key):
+                    _log.info("%s: up to date", name)
+                    status[name] = "up to date"
+                elif dry_run:
+                    status[name] = "would run"
+                else:
+                    _log.info("%s: running", name)
+                    for output in stage.outputs:
+                        (root / output).parent.mkdir(parents=True, exist_ok=True)
+                    running[executor.submit(_run_stage, name, config, str(root))] = (stage, key)
+                    status[name] = "running"
+
+            if dry_run:
+                # Anything depending on a stage which would run, would run too
+                for name in selected:
+                    if name not in status and any(
+                        status.get(dep) == "would run" for dep in STAGES[name].deps
+                    ):
+                        status[name] = "would run"
+                break
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                seconds = future.result()
+                manifest.record(stage, key, seconds)
+                status[stage.name] = "ran"
+                _log.info("%s: finished in %.1f s", stage.name, seconds)
+    return status
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stages", nargs="*",
+                        help=f"stages to bring up to date (default all): {list(STAGES)}")
+    parser.add_argument("--jobs", type=int, help="stages to run at the same time")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="run STAGE even if it is up to date")
+    parser.add_argument("--config", type=Path,
+                        help="JSON file overriding entries of the default configuration")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override one configuration entry (VALUE is JSON)")
+    parser.add_argument("--dry-run", action="store_true", help="only list what would run")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    config = json.loads(args.config.read_text()) if args.config else {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        config[key] = _parse_value(value)
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        parser.error(f"unknown configuration entries: {sorted(unknown)}")
+
+    status = run(args.stages, config, jobs=args.jobs, force=set(args.force),
+                 dry_run=args.dry_run)
+    for name, stage_status in status.items():
+        print(f"{name:15s} {stage_status}")
+
+
+if __name__ == "__main__":
+    main()
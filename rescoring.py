@@ -0,0 +1,224 @@
+"""Score stored Monte Carlo inventories with other characterization factors.
+
+LCIA scores are linear in the characterization factors: a contribution is
+the sum over biosphere flows of (flow amount x factor). If the biosphere
+inventory of each contribution group is stored for each sample (pass a
+`GroupInventoryStore` as `group_inventory=` to
+`collect_contribution_samples`), any number of other methods, GWP time
+horizons or factor sweeps can be scored afterwards with one matrix product,
+without solving the system again::
+
+    store = GroupInventoryStore("results/inventories")
+    factors = method_factors([("IPCC 2013", "climate change", "GWP 20a"),
+                              ("IPCC 2013", "climate change", "GWP 100a")])
+    cube = rescore(store, factors)   # (scenario, sample, demand, component)
+
+The store only needs brightway2 to be created; reading and rescoring don't.
+"""
+
+import itertools
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mc_results import _label, _label_scenarios, _to_dataframe
+
+_log = logging.getLogger(__name__)
+
+
+class GroupInventoryStore:
+    """Biosphere inventory of each contribution group, per sample and demand.
+
+    `path` is a directory holding `metadata.json`, the float32 memory map
+    `inventory.f32` (sample x demand x component x flow) and `recorded.u1`
+    marking the samples which have been written. Open an existing store
+    with just `path`; to create one, also give `num_samples`,
+    `demand_labels`, `components` (every label of the mapping, for example
+    `component_order`) and `flows`, the biosphere flow keys to keep (for
+    example `list(lca.biosphere_dict)`, or only the flows with factors in
+    the methods of interest). Like `mc_results.InventoryStore`, it is pickled
+    by path so worker processes write to the same files.
+    """
+
+    def __init__(self, path, num_samples=None, demand_labels=None, components=None,
+                 flows=None):
+        self.path = Path(path)
+        metadata_path = self.path / "metadata.json"
+        if flows is not None:
+            metadata = json.loads(json.dumps({
+                "num_samples": int(num_samples),
+                "demands": list(demand_labels),
+                "components": list(components),
+                "flows": [list(flow) for flow in flows],
+            }))
+            if not metadata_path.exists():
+                self.path.mkdir(parents=True, exist_ok=True)
+                self.metadata = metadata
+                self._open(mode="w+")
+                metadata_path.write_text(json.dumps(metadata, indent=2))
+                _log.info("Created group inventory store %s", self.path)
+        self.metadata = json.loads(metadata_path.read_text())
+        if flows is not None and self.metadata != metadata:
+            raise ValueError(f"Existing inventories in {self.path} have different metadata")
+        self._open()
+
+    def _open(self, mode="r+"):
+        self.inventory = np.memmap(
+            self.path / "inventory.f32", dtype=np.float32, mode=mode,
+            shape=(self.num_samples, len(self.demand_labels), len(self.components),
+                   len(self.flows)),
+        )
+        self.recorded = np.memmap(self.path / "recorded.u1", dtype=np.uint8, mode=mode,
+                                  shape=(self.num_samples,))
+        self._indices = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.metadata = json.loads((self.path / "metadata.json").read_text())
+        self._open()
+
+    @property
+    def num_samples(self):
+        return self.metadata["num_samples"]
+
+    @property
+    def demand_labels(self):
+        return [_label(label) for label in self.metadata["demands"]]
+
+    @property
+    def components(self):
+        return self.metadata["components"]
+
+    @property
+    def flows(self):
+        return [tuple(flow) for flow in self.metadata["flows"]]
+
+    def indices(self, biosphere_dict):
+        """Matrix rows of the store's flows in `biosphere_dict`."""
+        if self._indices is None or self._indices[0] is not biosphere_dict:
+            self._indices = (
+                biosphere_dict,
+                np.array([biosphere_dict[flow] for flow in self.flows], dtype=int),
+            )
+        return self._indices[1]
+
+    def write(self, iteration, inventory):
+        """Store one sample's (demand x component x flow) inventory."""
+        self.inventory[iteration] = inventory
+        self.recorded[iteration] = 1
+
+    def flush(self):
+        self.inventory.flush()
+        self.recorded.flush()
+
+    @property
+    def num_completed(self):
+        """Number of samples at the start of the store which are complete."""
+        recorded = np.asarray(self.recorded, dtype=bool)
+        return len(recorded) if recorded.all() else int(np.argmin(recorded))
+
+
+def method_factors(methods):
+    """Characterization factors {method: {flow: factor}} of brightway2 methods."""
+    import brightway2 as bw
+
+    factors = {}
+    for method in methods:
+        factors[method] = {
+            tuple(flow): cf["amount"] if isinstance(cf, dict) else cf
+            for flow, cf in bw.Method(method).load()
+        }
+    return factors
+
+
+def parameter_grid(build, **axes):
+    """Characterization factors for every combination of parameter values.
+
+    `build(**params)` returns a {flow: factor} dictionary; `axes` gives the
+    values to try for each parameter. Returns {params: factors}, where
+    `params` is a tuple of the parameter values in the order of `axes`, for
+    use with `rescore`. For example::
+
+        factors = parameter_grid(
+            lambda ch4: {co2: 1.0, ch4_fossil: ch4, ch4_biogenic: ch4 - 2.75},
+            ch4=np.linspace(25, 35, 11),
+        )
+    """
+    names = list(axes)
+    return {
+        values: build(**dict(zip(names, values)))
+        for values in itertools.product(*axes.values())
+    }
+
+
+def factor_matrix(store, factors):
+    """Stack {scenario: {flow: factor}} into a (scenario x flow) array.
+
+    Factors for flows which are not kept in `store` are left out (methods
+    usually have factors for many flows which are not in the database);
+    how many is logged.
+    """
+    position = {flow: i for i, flow in enumerate(store.flows)}
+    matrix = np.zeros((len(factors), len(position)))
+    for i, (scenario, scenario_factors) in enumerate(factors.items()):
+        missing = 0
+        for flow, factor in scenario_factors.items():
+            flow = getattr(flow, "key", flow)
+            if flow in position:
+                matrix[i, position[flow]] += factor
+            elif factor:
+                missing += 1
+        if missing:
+            _log.info("%s: %d factors for flows not in the store", scenario, missing)
+    return matrix
+
+
+def rescore(store, factors, samples=None, chunk_size=100):
+    """Score the stored inventories with each set of `factors`.
+
+    `factors` is a dictionary {scenario: {flow: factor}}, as returned by
+    `method_factors` or `parameter_grid`. Returns an array (scenario x sample
+    x demand x component), for the complete samples at the start of the
+    store unless `samples` is given. The inventories are read `chunk_size`
+    samples at a time, and each chunk is scored for every scenario by one
+    matrix product.
+    """
+    matrix = factor_matrix(store, factors)
+    if samples is None:
+        samples = np.arange(store.num_completed)
+    _, num_demands, num_components, num_flows = store.inventory.shape
+    cube = np.empty((len(matrix), len(samples), num_demands, num_components))
+    for start in range(0, len(samples), chunk_size):
+        chunk = np.asarray(store.inventory[samples[start:start + chunk_size]], dtype=float)
+        scores = chunk.reshape(-1, num_flows) @ matrix.T
+        cube[:, start:start + len(chunk)] = np.moveaxis(
+            scores.reshape(len(chunk), num_demands, num_components, len(matrix)), -1, 0
+        )
+    return cube
+
+
+def rescore_frame(store, factors, samples=None, **kwargs):
+    """`rescore`, as a DataFrame like `collect_contribution_samples` returns.
+
+    The "method" column holds the scenario (the keys of `factors`), and
+    "activity labels" is left empty.
+    """
+    cube = rescore(store, factors, samples, **kwargs)
+    frames = []
+    for scenario, scores in zip(factors, cube):
+        df = _to_dataframe(scores, np.full(len(scores), None, dtype=object), {
+            "scenarios": list(range(len(store.demand_labels))),
+            "components": store.components,
+            "method": None,
+        })
+        df["method"] = [scenario] * len(df)
+        if samples is not None:
+            df["iteration"] = np.asarray(samples)[df["iteration"]]
+        frames.append(df)
+    return _label_scenarios(pd.concat(frames, ignore_index=True), store.demand_labels)
@@ -0,0 +1,227 @@
+"""Global sensitivity analysis from recorded Monte Carlo input draws.
+
+`MyMonteCarloLCA(..., record_draws=path, num_draws=n)` writes the values
+drawn for every uncertain technosphere, biosphere and characterization entry
+(and the entries set by presamples) to an `InputDrawStore`: one float32
+memory-mapped array (sample x entry) per group. The functions here relate
+those draws to any per-sample result -- a total score, a contribution, or
+the ratio between two treatments -- working through the entries in chunks,
+so the draws never have to fit in memory::
+
+    store = InputDrawStore("results/draws")
+    scores, _, metadata = load_contribution_arrays("results/gwp_samples")
+    ratio = scores[:, 0].sum(axis=1) / scores[:, 1].sum(axis=1)
+    table = sensitivity_table(store, ratio, method="spearman")
+
+Like `mc_results`, this module doesn't need brightway2. The "row" and "col"
+of each entry are its indices in the LCA matrices;
+`MyMonteCarloLCA.label_draws` turns them into activity keys.
+"""
+
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+_log = logging.getLogger(__name__)
+
+
+class InputDrawStore:
+    """Sampled input values, as float32 memory-mapped arrays in `path`.
+
+    `path` is a directory holding `metadata.json`, and for each group (such
+    as "technosphere") `<group>.f32` with the draws (sample x entry) and
+    `<group>-entries.npy` with the matrix (row, col) of each entry.
+    `recorded.u1` marks the samples which have been written.
+
+    Open an existing store with just `path`. To create one, also give
+    `num_samples` and `entries`, a dictionary {group: (rows, cols)}; if the
+    store already exists with the same shape it is opened instead. Several
+    processes can write different samples to the same store, but it must
+    be created first, in one process: creating it truncates the files.
+    """
+
+    def __init__(self, path, num_samples=None, entries=None):
+        self.path = Path(path)
+        metadata_path = self.path / "metadata.json"
+        if entries is not None and not metadata_path.exists():
+            self._create(num_samples, entries)
+        self.metadata = json.loads(metadata_path.read_text())
+        if entries is not None:
+            expected = {group: len(rows) for group, (rows, _) in entries.items()}
+            if self.metadata != {"num_samples": num_samples, "groups": expected}:
+                raise ValueError(
+                    f"Existing draws in {self.path} have different metadata: {self.metadata}"
+                )
+
+        self.draws = {
+            group: np.memmap(self.path / f"{group}.f32", dtype=np.float32, mode="r+",
+                             shape=(self.num_samples, size))
+            for group, size in self.metadata["groups"].items()
+        }
+        self.entries = {
+            group: np.load(self.path / f"{group}-entries.npy")
+            for group in self.metadata["groups"]
+        }
+        self.recorded = np.memmap(self.path / "recorded.u1", dtype=np.uint8, mode="r+",
+                                  shape=(self.num_samples,))
+
+    def _create(self, num_samples, entries):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for group, (rows, cols) in entries.items():
+            np.save(self.path / f"{group}-entries.npy", np.column_stack([rows, cols]).astype(np.int64))
+            np.memmap(self.path / f"{group}.f32", dtype=np.float32, mode="w+",
+                      shape=(num_samples, len(rows))).flush()
+        np.memmap(self.path / "recorded.u1", dtype=np.uint8, mode="w+",
+                  shape=(num_samples,)).flush()
+        metadata = {
+            "num_samples": int(num_samples),
+            "groups": {group: len(rows) for group, (rows, _) in entries.items()},
+        }
+        (self.path / "metadata.json").write_text(json.dumps(metadata, indent=2))
+        _log.info("Created input draw store %s", self.path)
+
+    @property
+    def num_samples(self):
+        return self.metadata["num_samples"]
+
+    @property
+    def groups(self):
+        return list(self.metadata["groups"])
+
+    def write(self, sample, values):
+        """Store the draws {group: values} for one sample."""
+        for group, group_values in values.items():
+            self.draws[group][sample] = group_values
+        self.recorded[sample] = 1
+
+    def flush(self):
+        for draws in self.draws.values():
+            draws.flush()
+        self.recorded.flush()
+
+    def recorded_samples(self):
+        """Indices of the samples which have been written."""
+        return np.flatnonzero(self.recorded)
+
+
+def _column_chunks(num_columns, num_samples, max_memory):
+    step = max(1, int(max_memory // (8 * max(num_samples, 1))))
+    for start in range(0, num_columns, step):
+        yield slice(start, min(start + step, num_columns))
+
+
+def _as_outputs(scores):
+    scores = np.asarray(scores, dtype=float)
+    return scores.reshape(len(scores), -1)
+
+
+def spearman(draws, scores, max_memory=256e6):
+    """Spearman rank correlation of each column of `draws` with `scores`.
+
+    `draws` is a (sample x entry) array, which can be a memory map; it is
+    read `max_memory` bytes of columns at a time. `scores` has one value
+    per sample, or one column per output. Returns an array (entry x output).
+    Entries which are constant get NaN.
+    """
+    outputs = _as_outputs(scores)
+    num_samples = len(outputs)
+    ranked = rankdata(outputs, axis=0)
+    ranked = (ranked - ranked.mean(axis=0)) / ranked.std(axis=0)
+
+    result = np.empty((draws.shape[1], outputs.shape[1]))
+    for columns in _column_chunks(draws.shape[1], num_samples, max_memory):
+        chunk = rankdata(np.asarray(draws[:, columns], dtype=float), axis=0)
+        chunk -= chunk.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            chunk /= chunk.std(axis=0)
+        result[columns] = chunk.T @ ranked / num_samples
+    return result
+
+
+def first_order_indices(draws, scores, bins=20, max_memory=256e6):
+    """Estimate first-order (Sobol) sensitivity indices by binning.
+
+    For each column of `draws`, the samples are split into `bins` bins of
+    equal size by the rank of the draw, and the index is the variance of the
+    mean of `scores` in each bin, as a fraction of the total variance:
+    Var(E[Y | X_i]) / Var(Y). This works on the existing Monte Carlo samples,
+    without a dedicated sampling design; with few samples per bin it is
+    biased upwards by about 1 / (samples per bin). Arguments and result are
+    as for `spearman`.
+    """
+    outputs = _as_outputs(scores)
+    num_samples, num_outputs = outputs.shape
+    centred = outputs - outputs.mean(axis=0)
+    variance = (centred ** 2).mean(axis=0)
+
+    result = np.empty((draws.shape[1], num_outputs))
+    for columns in _column_chunks(draws.shape[1], num_samples, max_memory):
+        chunk = np.asarray(draws[:, columns], dtype=float)
+        num_columns = chunk.shape[1]
+        # Bin number of each sample for each entry, offset so every
+        # (entry, bin) pair has its own slot in one flat bincount
+        ranks = rankdata(chunk, axis=0, method="ordinal") - 1
+        slots = ranks * bins // num_samples + bins * np.arange(num_columns)
+        counts = np.bincount(slots.ravel(), minlength=bins * num_columns)
+        for k in range(num_outputs):
+            sums = np.bincount(
+                slots.ravel(), weights=np.repeat(centred[:, k], num_columns),
+                minlength=bins * num_columns,
+            )
+            with np.errstate(invalid="ignore", divide="ignore"):
+                between = np.where(counts > 0, sums ** 2 / counts, 0)
+            result[columns, k] = between.reshape(num_columns, bins).sum(axis=1) / (
+                num_samples * variance[k]
+            )
+    return result
+
+
+def sensitivity_table(store, scores, method="spearman", samples=None, **kwargs):
+    """Sensitivity of `scores` to every recorded entry, as a DataFrame.
+
+    `scores` has one value per sample of the store (or one column per
+    output); only the samples given in `samples` (by default, those which
+    have been recorded) are used. `method` is "spearman" or "sobol" (see
+    `spearman` and `first_order_indices`). The result has columns "group",
+    "row", "col" and one column per output, sorted by the absolute value of
+    the first output, largest first.
+    """
+    functions = {"spearman": spearman, "sobol": first_order_indices}
+    if method not in functions:
+        raise ValueError(f"Unknown method: {method}")
+    if samples is None:
+        samples = store.recorded_samples()
+    outputs = _as_outputs(scores)[samples]
+    names = [f"output {k}" for k in range(outputs.shape[1])] if outputs.shape[1] > 1 else [method]
+
+    tables = []
+    for group in store.groups:
+        draws = store.draws[group]
+        if samples is not None and len(samples) != len(draws):
+            draws = _SampleView(draws, samples)
+        values = functions[method](draws, outputs, **kwargs)
+        table = pd.DataFrame(values, columns=names)
+        table.insert(0, "col", store.entries[group][:, 1])
+        table.insert(0, "row", store.entries[group][:, 0])
+        table.insert(0, "group", group)
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+    order = np.argsort(-np.nan_to_num(np.abs(table[names[0]].to_numpy()), nan=-1), kind="stable")
+    return table.iloc[order].reset_index(drop=True)
+
+
+class _SampleView:
+    """Some rows of a (sample x entry) array, read a block of columns at a time."""
+
+    def __init__(self, draws, samples):
+        self.draws = draws
+        self.samples = np.asarray(samples)
+        self.shape = (len(self.samples), draws.shape[1])
+
+    def __getitem__(self, index):
+        rows, columns = index
+        return self.draws[:, columns][self.samples][rows]
@@ -0,0 +1,115 @@
+"""A small synthetic Brightway project for the tests.
+
+The project uses the activity keys and method names of the real project,
+as given in `pipeline.DEFAULT_CONFIG` and `final_activities`, so the
+helpers and the pipeline run against it unchanged. It is created in a
+temporary Brightway directory, never in the user's own.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT))
+
+# Set before brightway2 is imported; worker processes inherit it too
+BRIGHTWAY_DIR = tempfile.mkdtemp(prefix="bw2-knee-oa-tests-")
+os.environ["BRIGHTWAY2_DIR"] = BRIGHTWAY_DIR
+
+from pipeline import DEFAULT_CONFIG  # noqa: E402
+
+PROJECT = "knee-oa-tests"
+CO2 = ("biosphere", "co2")
+DEVICES = {label: tuple(key) for label, key in DEFAULT_CONFIG["devices"].items()}
+METALS = {label: tuple(key) for label, key in DEFAULT_CONFIG["metals"].items()}
+SWAPS = [
+    (tuple(swap["old"]), tuple(swap["new"]), [tuple(output) for output in swap["outputs"]])
+    for swap in DEFAULT_CONFIG["electricity_swaps"]
+]
+METHODS = [tuple(method) for method in DEFAULT_CONFIG["methods"]]
+METHOD = tuple(DEFAULT_CONFIG["method"])
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(BRIGHTWAY_DIR, ignore_errors=True)
+
+
+def _exchange(key, amount, kind="technosphere", scale=0.1):
+    """An exchange with a lognormal uncertainty around `amount`."""
+    return {"input": key, "amount": amount, "type": kind,
+            "uncertainty type": 2, "loc": float(np.log(amount)), "scale": scale}
+
+
+def _inventory():
+    """{database: {key: activity data}} for the synthetic project."""
+    data = {}
+
+    def add(key, *exchanges):
+        data.setdefault(key[0], {})[key] = {
+            "name": key[1],
+            "unit": "unit",
+            "location": "GLO",
+            "exchanges": [{"input": key, "amount": 1, "type": "production"}, *exchanges],
+        }
+
+    for old, new, _ in SWAPS:
+        add(old, _exchange(CO2, 0.3, "biosphere"))
+        add(new, _exchange(CO2, 0.03, "biosphere"))
+    for key in METALS.values():
+        add(key, _exchange(CO2, 5.0, "biosphere"))
+
+    # The processes whose electricity is swapped in the greener scenario,
+    # with an empty input of the new electricity for presamples to fill
+    for old, new, outputs in SWAPS:
+        for output in outputs:
+            add(output, _exchange(old, 2.0), _exchange(METALS["Ti6Al4V_powder"], 0.05),
+                {"input": new, "amount": 0, "type": "technosphere"})
+
+    outputs = [output for _, _, swap_outputs in SWAPS for output in swap_outputs]
+    add(DEVICES["AM HTO"], *[
+        _exchange(output, 1.0) for output in outputs if output[0] == DEVICES["AM HTO"][0]
+    ])
+    add(DEVICES["AM HTO (steel jig)"], *[_exchange(output, 1.0) for output in outputs],
+        _exchange(METALS["stainless_steel"], 0.2))
+    add(DEVICES["CM HTO"], _exchange(METALS["Ti6Al4V_workpiece"], 0.3),
+        _exchange(SWAPS[0][0], 3.0))
+    add(DEVICES["UKR"], _exchange(METALS["CoCr"], 0.2), _exchange(SWAPS[1][0], 2.0))
+    return data
+
+
+def build_project():
+    """Create the synthetic project, if it doesn't exist yet, and make it current."""
+    import bw2data as bd
+
+    bd.projects.set_current(PROJECT)
+    if "UKR" in bd.databases:
+        return
+    bd.Database("biosphere").write({
+        CO2: {"name": "carbon dioxide", "unit": "kilogram", "type": "emission",
+              "categories": ("air",)},
+    })
+    data = _inventory()
+    for name in ["Electricity", "Raw materials", "AM HTO", "AM HTO- jig steel", "CM HTO", "UKR"]:
+        bd.Database(name).write(data[name])
+    # Only the main method's factors are uncertain, so the others score the
+    # same whichever generator draws them
+    for i, method in enumerate(dict.fromkeys([METHOD, *METHODS])):
+        cf = {"amount": float(i + 1), "uncertainty type": 0, "loc": float(i + 1)}
+        if method == METHOD:
+            cf.update({"uncertainty type": 3, "scale": 0.05})
+        bd.Method(method).register(unit="unit")
+        bd.Method(method).write([(CO2, cf)])
+
+
+@pytest.fixture(scope="session")
+def project():
+    """Name of the synthetic project, which is made current."""
+    pytest.importorskip("brightway2")
+    build_project()
+    return PROJECT
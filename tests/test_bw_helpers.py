@@ -0,0 +1,113 @@
+"""Tests of `bw_helpers` against the synthetic project (see `conftest.py`)."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("brightway2")
+pytest.importorskip("presamples")
+
+import bw2calc as bc  # noqa: E402
+from bw_helpers import (  # noqa: E402
+    MyMonteCarloLCA,
+    build_swap_presamples,
+    collect_contribution_samples,
+    collect_until_converged,
+    recursive_calculation,
+    sample_comparative_contribution,
+)
+from conftest import DEVICES, METHOD, METHODS, SWAPS  # noqa: E402
+from final_activities import component_order, final_activities  # noqa: E402
+from mc_results import ContributionSampleSink  # noqa: E402
+
+
+def _collect(lca, labels, **kwargs):
+    return collect_contribution_samples(
+        lca, [{DEVICES[label]: 1} for label in labels], final_activities,
+        method_label=METHOD[1], demand_labels=labels, component_order=component_order,
+        **kwargs
+    )
+
+
+def test_build_swap_presamples(project, tmp_path):
+    package_id, path = build_swap_presamples(SWAPS, 10, seed=1, directory=tmp_path)
+    # The same inputs reuse the package; without a seed, each call draws anew
+    assert build_swap_presamples(SWAPS, 10, seed=1, directory=tmp_path)[0] == package_id
+    unseeded = build_swap_presamples(SWAPS, 10, directory=tmp_path)[0]
+    assert build_swap_presamples(SWAPS, 10, directory=tmp_path)[0] != unseeded
+
+    lca = MyMonteCarloLCA({key: 1 for key in DEVICES.values()}, method=METHOD,
+                          presamples=[Path(path)], seed=1)
+    next(lca)
+    for old, new, outputs in SWAPS:
+        for output in outputs:
+            col = lca.activity_dict[output]
+            assert lca.technosphere_matrix[lca.product_dict[old], col] == 0
+            assert lca.technosphere_matrix[lca.product_dict[new], col] < 0
+
+
+def test_parallel_samples_after_serial_sample(project):
+    # The devices are in different databases, so the technosphere for the
+    # last demand sampled is smaller than the one for both together
+    labels = ["AM HTO", "UKR"]
+    lca = MyMonteCarloLCA({DEVICES[label]: 1 for label in labels}, method=METHOD)
+    next(lca)
+    serial = _collect(lca, labels, num_samples=4, seed=3, block_size=2)
+    parallel = _collect(lca, labels, num_samples=4, seed=3, block_size=2, processes=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_all_methods_samples_match_single_method_runs(project):
+    demand = {DEVICES["CM HTO"]: 1}
+    methods = [METHOD, *[method for method in METHODS if method != METHOD][:2]]
+    lca = MyMonteCarloLCA(demand, method=METHOD, seed=5)
+    next(lca)
+    lca.load_methods(methods)
+    tables = [sample_comparative_contribution(lca, [demand], final_activities,
+                                              all_methods=True)[0]
+              for _ in range(2)]
+
+    for method in methods:
+        single = MyMonteCarloLCA(demand, method=method, seed=5)
+        next(single)
+        for table in tables:
+            result = sample_comparative_contribution(single, [demand], final_activities)[0]
+            assert list(table.columns) == list(result)
+            for label, score in result.items():
+                assert table.loc[method[1], label] == pytest.approx(score, rel=1e-9)
+
+
+def test_collect_until_converged_with_sink(project, tmp_path):
+    labels = ["CM HTO", "UKR"]
+    lca = MyMonteCarloLCA({DEVICES[label]: 1 for label in labels}, method=METHOD)
+    next(lca)
+    sink = ContributionSampleSink(tmp_path, 12, labels, component_order, METHOD[1],
+                                  chunk_size=4)
+    samples, _ = collect_until_converged(
+        lca, [{DEVICES[label]: 1} for label in labels], final_activities, METHOD[1],
+        labels, component_order, targets={"median": 0}, batch_size=5, min_samples=5,
+        max_samples=12, seed=2, block_size=4, sink=sink,
+    )
+    assert sorted(samples["iteration"].unique()) == list(range(12))
+    assert len(samples) == 12 * len(labels) * len(component_order)
+
+
+def test_recursive_calculation_old_arguments(project):
+    below_root = {key: label for key, label in final_activities.items() if label != "Total"}
+    device = DEVICES["CM HTO"]
+    trace = []
+    result = recursive_calculation(device, below_root, METHOD, max_level=5, trace=trace)
+    assert trace
+
+    lca = bc.LCA({device: 1}, METHOD)
+    lca.lci(factorize=True)
+    lca.lcia()
+    # The old positional order still works; total_score and level are deprecated
+    with pytest.warns(DeprecationWarning):
+        old = recursive_calculation(device, below_root, METHOD, lca, lca.score, 1, 0, 5)
+    assert old == pytest.approx(result)
+    with pytest.warns(DeprecationWarning):
+        shallower = recursive_calculation(device, below_root, METHOD, level=2, max_level=5)
+    assert shallower == pytest.approx(recursive_calculation(device, below_root, METHOD,
+                                                            max_level=3))
@@ -0,0 +1,126 @@
+"""Tests of `mc_results` against the calculations in the notebooks."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mc_results import (
+    ContributionSampleSink,
+    InventoryStore,
+    StatisticsAccumulator,
+    hdi,
+    regroup_contributions,
+)
+
+SCENARIOS = ["UKR", "CM HTO", "AM HTO"]
+ENERGY_SCENARIOS = ["Current", "Greener"]
+COMPONENTS = ["Implant (material)", "Instruments (manufac.)", "Anesthesia"]
+
+
+@pytest.fixture
+def samples():
+    """Samples in the long format of `samples_comparative_gwp_contributions.csv`."""
+    rng = np.random.default_rng(0)
+    rows = []
+    for scenario in SCENARIOS:
+        for energy_scenario in ENERGY_SCENARIOS:
+            for iteration in range(40):
+                scores = rng.lognormal(size=len(COMPONENTS))
+                # Like the device's own entry in `final_activities`
+                rows.append((scenario, "Total", "climate change", iteration, scores.sum(),
+                             energy_scenario))
+                rows.extend(
+                    (scenario, component, "climate change", iteration, score, energy_scenario)
+                    for component, score in zip(COMPONENTS, scores)
+                )
+    return pd.DataFrame(rows, columns=["scenario", "component", "method", "iteration",
+                                       "score", "energy_scenario"])
+
+
+def notebook_ratios(samples_combined_incl_total):
+    """`stats_totals_ratios.csv` as Figures.ipynb and the ratios notebook make it."""
+    # Figures.ipynb
+    samples_combined = samples_combined_incl_total[
+        samples_combined_incl_total["component"] != "Total"
+    ]
+    df = samples_combined.groupby(["scenario", "energy_scenario", "method", "iteration"])[
+        "score"].sum()
+    relative = pd.concat({
+        (scenario, energy_scenario): df.loc[scenario, energy_scenario] / df.loc["CM HTO", "Current"]
+        for scenario in samples_combined["scenario"].unique()
+        for energy_scenario in samples_combined["energy_scenario"].unique()
+        if (scenario, energy_scenario) not in [("UKR", "Greener"), ("CM HTO", "Greener")]
+    }, axis=0, names=["scenario", "energy_scenario"]).reset_index()
+
+    # Statistical description of results-ratios.ipynb (with hdi for az.hdi)
+    total = relative.groupby(["scenario", "energy_scenario", "iteration"])["score"].sum()
+    total = total.reset_index()
+
+    def calculate_percentiles_and_iqr(group):
+        q25 = group["score"].quantile(0.25)
+        q75 = group["score"].quantile(0.75)
+        hdi_90 = hdi(group["score"].to_numpy(), 0.9)
+        return pd.Series({
+            "mean": group["score"].mean(), "median": group["score"].median(),
+            "minimum": group["score"].min(), "maximum": group["score"].max(),
+            "25th Percentile": q25, "75th Percentile": q75, "IQR": q75 - q25,
+            "hdi_90_lower": hdi_90[0], "hdi_90_upper": hdi_90[1],
+        })
+
+    return total.groupby(["scenario", "energy_scenario"]).apply(
+        calculate_percentiles_and_iqr
+    ).reset_index()
+
+
+@pytest.mark.parametrize("by_iteration", [False, True])
+def test_stats_totals_ratios_match_notebooks(samples, by_iteration):
+    accumulator = StatisticsAccumulator()
+    if by_iteration:
+        for (energy_scenario, iteration), group in samples.groupby(
+                ["energy_scenario", "iteration"]):
+            results = [
+                dict(zip(group_rows["component"], group_rows["score"]))
+                for _, group_rows in group.groupby("scenario", sort=False)
+            ]
+            labels = list(group.groupby("scenario", sort=False).groups)
+            accumulator.add(iteration, labels, results, energy_scenario=energy_scenario)
+    else:
+        accumulator.add_frame(samples)
+
+    expected = notebook_ratios(samples)
+    result = accumulator.stats_totals_ratios()
+    pd.testing.assert_frame_equal(result[expected.columns], expected)
+
+
+def test_regroup_skips_activities_not_in_store(tmp_path):
+    activities = [("AM HTO", "print"), ("Electricity", "grid")]
+    store = InventoryStore(tmp_path, 2, ["AM HTO"], activities)
+    for iteration in range(2):
+        store.write(iteration, [[1.0, 2.0]], [[3.0, 4.0]], [10.0])
+    mapping = {("AM HTO", "print"): "Implant (manufac.)",
+               ("Electricity", "grid"): "Implant (manufac.)",
+               ("UKR", "casting"): "Implant (material)"}
+
+    df = regroup_contributions(store, mapping)
+    scores = df.groupby("component")["score"].sum()
+    assert scores["Implant (manufac.)"] == pytest.approx(14.0)
+    assert scores["Implant (material)"] == 0
+    with pytest.raises(KeyError):
+        regroup_contributions(store, mapping, strict=True)
+
+
+def _all_methods_results():
+    """Results as `sample_comparative_contribution(..., all_methods=True)` gives them."""
+    return [pd.DataFrame({"Total": [3.0, 0.1], "Anesthesia": [1.0, 0.02]},
+                         index=["climate change", "land use"])]
+
+
+def test_sink_rejects_all_methods_results(tmp_path):
+    sink = ContributionSampleSink(tmp_path, 2, ["CM HTO"], ["Total", "Anesthesia"])
+    with pytest.raises(ValueError, match="all methods"):
+        sink.add(0, _all_methods_results())
+
+
+def test_accumulator_rejects_all_methods_results():
+    with pytest.raises(ValueError, match="all methods"):
+        StatisticsAccumulator().add(0, ["CM HTO"], _all_methods_results())
@@ -0,0 +1,45 @@
+"""Run the whole pipeline on the synthetic project (see `conftest.py`)."""
+
+import shutil
+
+import pytest
+
+pytest.importorskip("brightway2")
+pytest.importorskip("presamples")
+pytest.importorskip("nbconvert")
+
+import pipeline  # noqa: E402
+from conftest import PROJECT, ROOT  # noqa: E402
+
+
+def test_run_every_stage(project, tmp_path):
+    sources = {
+        path for stage in pipeline.STAGES.values() for source in stage.sources
+        for path in pipeline.local_imports(source, ROOT)
+    }
+    for source in sources:
+        shutil.copy(ROOT / source, tmp_path / source)
+    config = {"project": PROJECT, "num_samples": 20, "seed": 1}
+
+    status = pipeline.run(config=config, jobs=2, root=tmp_path)
+    assert status == {name: "ran" for name in pipeline.STAGES}
+    for stage in pipeline.STAGES.values():
+        for output in stage.outputs:
+            assert (tmp_path / output).stat().st_size > 0
+
+    # Nothing has changed, so nothing runs again
+    status = pipeline.run(config=config, root=tmp_path)
+    assert status == {name: "up to date" for name in pipeline.STAGES}
+
+
+def test_key_covers_imported_modules(tmp_path):
+    for source in ["bw_helpers.py", "final_activities.py", "instrumentation.py",
+                   "mc_results.py", "sensitivity.py"]:
+        shutil.copy(ROOT / source, tmp_path / source)
+    stage = pipeline.STAGES["metals"]
+    config = {**pipeline.DEFAULT_CONFIG, "project": PROJECT}
+    manifest = pipeline.Manifest(tmp_path)
+    key = pipeline.stage_key(stage, config, manifest, tmp_path)
+    with open(tmp_path / "instrumentation.py", "a") as f:
+        f.write("\n# changed\n")
+    assert pipeline.stage_key(stage, config, manifest, tmp_path) != key